@@ -402,23 +402,54 @@ Output a CSV file with FIPS code and county centers
 
 import math
 import csv
+import re
 
 
 
 # Parse the XMLin USA SVG file extract county attributes
 # Derive from example code - https://stackoverflow.com/questions/15857818/python-svg-parser
 
-from xml.dom import minidom
+from xml.etree.ElementTree import iterparse
+
+FIPS_CODE = re.compile(r'\d{5}')
+
+def is_fips_code(path_id):
+    """
+    Given the id of an SVG path (as string), return True if it is a county FIPS code
+    The SVG also has paths for the state lines and the inset separator, which are not counties
+    """
+    return FIPS_CODE.fullmatch(path_id) is not None
+
+def iter_county_attributes(svg_file_name, counties_only=True):
+    """
+    Given SVG file associate with string svg_file_name, stream county attributes from associated XML
+    Yield tuples consisting of FIPS codes (strings) and county boundaries (strings) as the file is read
+    Paths whose id is not a FIPS code are skipped unless counties_only is False
+    Each element is dropped from the tree as soon as it ends, so memory use does not grow with the file
+    """
+    open_elements = []
+    for event, elem in iterparse(svg_file_name, events=('start', 'end')):
+        if event == 'start':
+            open_elements.append(elem)
+            continue
+        open_elements.pop()
+        if elem.tag == 'path' or elem.tag.endswith('}path'):
+            path_id = elem.get('id', '')
+            if not counties_only or is_fips_code(path_id):
+                yield (path_id, elem.get('d', ''))
+        elem.clear()
+        if open_elements:
+            # The element that just ended is always the last child of its parent
+            del open_elements[-1][-1]
+
 
 def get_county_attributes(svg_file_name):
     """
     Given SVG file associate with string svg_file_name, extract county attributes from associated XML
     Return a list of tuples consisting of FIPS codes (strings) and county boundaries (strings)
+    for every path, including the State_Lines and separator paths
     """
-    doc=minidom.parse(svg_file_name)
-    path_strings=[(path.getAttribute('id'),path.getAttribute('d')) for path in doc.getElementsByTagName('path')]
-    
-    return path_strings
+    return list(iter_county_attributes(svg_file_name, counties_only=False))
                                           
 
 def test_get_attributes(svg_file_name):
@@ -446,15 +477,31 @@ def test_get_attributes(svg_file_name):
 
 # Code to compute the center of a county from its boundary (as a string)
 
+PATH_COMMANDS = re.compile('[LZz,]')
+
+def get_boundary_array(boundary_data):
+    """
+    Given the county boundary data as a string of absolute M/L/z path commands,
+    Return a tuple of an (N, 2) float array of the boundary coordinates and
+    an array with the index of the first point of each subpath (each 'M')
+    An empty boundary has no points and no subpaths
+    """
+    subpaths = [PATH_COMMANDS.sub(' ', subpath).split() for subpath in boundary_data.split('M')]
+    subpaths = [numbers for numbers in subpaths if numbers]
+    sizes = [len(numbers) // 2 for numbers in subpaths]
+    points = np.array([num for numbers in subpaths for num in numbers], dtype=float).reshape(-1, 2)
+    starts = np.cumsum([0] + sizes[:-1], dtype=int) if sizes else np.zeros(0, dtype=int)
+    return points, starts
+
+
 def get_boundary_coordinates(boundary_data):
     """
     Given the country boundary data as a string,
     Return the county boundary as a list of coordinates
     Ignores 'M', 'L, 'z'
     """
-    filterkey= set(['L','M','z'])
-    filtered_boundary=[floatboundary_data.rsplit()
-    return []
+    points, _ = get_boundary_array(boundary_data)
+    return [tuple(point) for point in points.tolist()]
 
 
 # Provided code to estimate a county center from a list of coordinates on county boundary
@@ -481,6 +528,63 @@ def compute_county_center(boundary_coordinates):
     return [(centroid[0] / perimeter), (centroid[1] / perimeter)]
 
 
+def compute_county_centers(boundaries):
+    """
+    Given a list of county boundaries as (points, subpath starts) tuples from get_boundary_array,
+    Return a (K, 2) array with the perimeter-weighted center of each county
+    Every subpath is treated as a closed polygon, so no edges join separate subpaths
+    Counties with no boundary (or a boundary of zero length) get a NaN center
+    """
+    if not boundaries:
+        return np.zeros((0, 2))
+    points = np.concatenate([pts for pts, _ in boundaries])
+    sizes = np.array([len(pts) for pts, _ in boundaries])
+    offsets = np.cumsum(sizes) - sizes
+    county = np.repeat(np.arange(len(boundaries)), sizes)
+
+    # Index of the point each point's edge goes to: the next point, or the
+    # first point of the subpath for the last point of each subpath
+    subpath_starts = np.concatenate([starts + offset for (_, starts), offset in zip(boundaries, offsets)])
+    subpath_ends = np.append(subpath_starts[1:], len(points)) - 1
+    following = np.arange(1, len(points) + 1)
+    following[subpath_ends] = subpath_starts
+
+    edge_lengths = np.hypot(*(points[following] - points).T)
+    midpoints = 0.5 * (points + points[following])
+    perimeter = np.bincount(county, weights=edge_lengths, minlength=len(boundaries))
+    center_x = np.bincount(county, weights=midpoints[:, 0] * edge_lengths, minlength=len(boundaries))
+    center_y = np.bincount(county, weights=midpoints[:, 1] * edge_lengths, minlength=len(boundaries))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.column_stack([center_x, center_y]) / perimeter[:, None]
+
+
+def iter_county_centers(county_attributes, batch_size=1024):
+    """
+    Given an iterable of (FIPS code, county boundary) tuples, e.g. from iter_county_attributes,
+    Yield (FIPS code, x-coord of center, y-coord of center) tuples
+    Counties are processed batch_size at a time, so only one batch of boundaries is held in memory
+    Counties with an empty boundary have no center and are skipped
+    """
+    batch = []
+    for fips, boundary in county_attributes:
+        points, starts = get_boundary_array(boundary)
+        if not len(points):
+            continue
+        batch.append((fips, (points, starts)))
+        if len(batch) == batch_size:
+            yield from _batch_centers(batch)
+            batch = []
+    yield from _batch_centers(batch)
+
+
+def _batch_centers(batch):
+    """
+    Given a list of (FIPS code, boundary array) tuples, return a list of (FIPS code, x, y) tuples
+    """
+    centers = compute_county_centers([boundary for _, boundary in batch])
+    return [(fips, x, y) for (fips, _), (x, y) in zip(batch, centers.tolist())]
+
+
 BOUNDARY_STRING1 = "M 412.47298,198.204 L 412.05498,198.597 L 411.68998,198.637 L 410.44998,197.371 L 409.73798,196.51 L 410.65298,195.31 L 412.14998,194.265 L 412.94598,194.016 L 413.28898,193.711 L 413.91998,193.075 L 414.86198,194.775 L 414.97098,194.936 L 414.77698,194.878 L 414.28998,195.071 L 412.64998,197.641 L 412.47298,198.204 z M 412.47298,198.204 L 412.47298,198.204"
 BOUNDARY_STRING2 = "M 124.80274,305.35735 L 123.03975,304.03435 L 123.48174,303.37435 L 124.36175,303.59335 L 125.02275,304.03435 L 125.46275,305.13535 L 124.80274,305.35735 M 125.90375,309.76335 L 126.12375,309.98335 L 125.02275,310.64335 L 124.58274,309.32235 L 123.92075,308.66035 L 123.92075,309.10235 L 123.70075,309.10235 L 121.71875,308.66035 L 121.71875,308.88135 L 122.59975,308.88135 L 123.92075,309.32235 L 124.80274,310.64335 L 123.48174,311.96535 L 122.59975,311.52535 L 122.15875,311.52535 L 121.49775,311.30535 L 119.29575,310.42235 L 120.17675,309.54235 L 121.49775,307.55935 L 122.15875,307.33935 L 122.15875,306.89835 L 124.14175,306.89835 L 125.02275,307.55935 L 124.80274,308.66035 L 125.90375,308.88135 L 126.34474,309.32235 L 125.90375,309.76335 M 134.27575,313.50735 L 133.61475,313.50735 L 133.39675,313.94835 L 133.17575,312.84635 L 132.07475,311.74535 L 132.07475,311.30535 L 131.85275,310.64335 L 131.85275,310.42235 L 132.29375,308.88135 L 135.81775,311.74535 L 134.93875,311.96535 L 134.49675,312.62535 L 134.27575,313.50735 M 129.20874,310.42235 L 129.86974,309.98335 L 129.86974,310.20135 L 131.63375,311.96535 L 131.19175,311.96535 L 130.53075,311.08435 L 130.31075,311.30535 L 131.85275,312.84635 L 132.07475,313.28835 L 131.63375,313.94835 L 131.63375,314.60935 L 130.97074,315.70935 L 130.31075,314.83035 L 130.31075,313.50735 L 129.20874,312.62535 L 128.32674,310.86435 L 127.44574,309.76335 L 127.44574,309.54235 L 127.66674,309.54235 L 128.32674,310.20135 L 128.54674,310.86435 L 128.98874,310.86435 L 128.98874,310.64335 L 129.20874,310.42235 M 126.78574,312.62535 L 125.90375,312.40635 L 125.90375,313.28835 L 125.02275,313.50735 L 124.36175,313.28835 L 124.14175,312.62535 L 124.36175,311.52535 L 125.24275,311.30535 L 125.68474,310.86435 L 128.10674,311.30535 L 128.32674,311.74535 L 128.54674,312.40635 L 128.32674,312.62535 L 127.88674,312.84635 L 126.78574,312.62535"
 
@@ -512,15 +616,18 @@ def process_county_attributes(svg_file_name, csv_file_name):
     Then compute county centers and write a CSV file with columns corresponding to FIPS code, x-coord of centers, y-coord of centers 
     """
 
-    # Extract county attibutes from SVG file
+    # Extract county attibutes from SVG file and compute centers as the file is read
+    county_centers = iter_county_centers(iter_county_attributes(svg_file_name))
     
     # Ouput CSV file
-    pass
+    with open(csv_file_name, 'w', newline='') as csv_file:
+        csv_writer = csv.writer(csv_file, delimiter=',', quoting=csv.QUOTE_MINIMAL)
+        csv_writer.writerows(county_centers)
     
     
-# Output CSV file should have 3143 rows
+# Output CSV file should have 3141 rows (one per county path; State_Lines and separator are left out)
     
-process_county_attributes("USA_Counties_2014.svg", "USA_Counties_with_FIPS_and_centers.csv")                                      
+#process_county_attributes("USA_Counties_2014.svg", "USA_Counties_with_FIPS_and_centers.csv")                                      
 
 
 
@@ -565,4 +672,312 @@ process_county_attributes("USA_Counties_2014.svg", "USA_Counties_with_FIPS_and_c
     
     
 
-    
\ No newline at end of file
+    
+
+# Spatial index over county centers, to match points (e.g. HOUSTON_POS) to counties
+
+USA_SVG_SIZE = [555, 352]
+
+class CountyCenterIndex:
+    """
+    Uniform grid over county centers supporting bulk nearest-k and within-radius queries
+    Centers are stored in the coordinates of the map size they were computed for; queries
+    for another map size (e.g. the 1000x634 PNG) are rescaled on the fly, without rebuilding
+    """
+
+    def __init__(self, fips_codes, centers, map_size=USA_SVG_SIZE, points_per_cell=2):
+        """
+        Given a list of FIPS codes and a matching (K, 2) array-like of county centers
+        in a map of size map_size ([width, height]), build the grid
+        """
+        self.fips_codes = np.array(fips_codes, dtype=str)
+        self.centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+        self.map_size = np.asarray(map_size, dtype=float)
+
+        self.origin = self.centers.min(axis=0) if len(self.centers) else np.zeros(2)
+        extent = (self.centers.max(axis=0) - self.origin) if len(self.centers) else np.ones(2)
+        area = max(extent[0] * extent[1], 1e-9)
+        self.cell_size = max(math.sqrt(area * points_per_cell / max(len(self.centers), 1)), 1e-9)
+        self.grid_shape = (np.floor(extent / self.cell_size).astype(int) + 1)
+
+        # Sort centers by cell so every row of cells is a contiguous slice
+        cells = self._cells(self.centers)
+        cell_ids = cells[:, 1] * self.grid_shape[0] + cells[:, 0]
+        self.order = np.argsort(cell_ids, kind='stable')
+        self.cell_starts = np.searchsorted(cell_ids[self.order],
+                                           np.arange(self.grid_shape[0] * self.grid_shape[1] + 1))
+
+    @classmethod
+    def from_csv(cls, csv_file_name, map_size=USA_SVG_SIZE):
+        """
+        Build the index from a CSV file of FIPS code, x-coord and y-coord of county centers,
+        as written by process_county_attributes; rows whose id is not a FIPS code are skipped
+        """
+        with open(csv_file_name, newline='') as csv_file:
+            rows = [row for row in csv.reader(csv_file) if row and is_fips_code(row[0])]
+        return cls([row[0] for row in rows], [[float(row[1]), float(row[2])] for row in rows], map_size)
+
+    def _cells(self, points):
+        """
+        Return the (x, y) grid cell of each point (in index coordinates), clipped to the grid
+        """
+        cells = np.floor((points - self.origin) / self.cell_size).astype(int)
+        return np.clip(cells, 0, self.grid_shape - 1)
+
+    def _scale(self, map_size):
+        """
+        Return the per-axis factor converting index coordinates to coordinates in a map of map_size
+        """
+        if map_size is None:
+            return np.ones(2)
+        return np.asarray(map_size, dtype=float) / self.map_size
+
+    def _candidates(self, cell, reach):
+        """
+        Return the positions of all centers in cells within reach cells of cell (in both axes)
+        """
+        x_lo, y_lo = np.maximum(cell - reach, 0)
+        x_hi, y_hi = np.minimum(cell + reach, self.grid_shape - 1)
+        slices = [self.order[self.cell_starts[row * self.grid_shape[0] + x_lo]:
+                             self.cell_starts[row * self.grid_shape[0] + x_hi + 1]]
+                  for row in range(y_lo, y_hi + 1)]
+        return np.concatenate(slices) if slices else np.zeros(0, dtype=int)
+
+    def nearest(self, points, k=1, map_size=None):
+        """
+        Given an (M, 2) array-like of points in a map of size map_size (defaults to the index map size),
+        Return a tuple of an (M, k) array of FIPS codes of the k nearest county centers, nearest first,
+        and an (M, k) array of their distances in the units of map_size
+        Raises ValueError if k is less than 1
+        """
+        if k < 1:
+            raise ValueError("k must be at least 1, got %r" % (k,))
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        k = min(k, len(self.centers))
+        scale = self._scale(map_size)
+        scaled_centers = self.centers * scale
+        index_points = points / scale
+        max_reach = int(self.grid_shape.max())
+        found = np.zeros((len(points), k), dtype=int)
+        distances = np.zeros((len(points), k))
+        for idx, (point, cell) in enumerate(zip(points, self._cells(index_points))):
+            reach = 0
+            while True:
+                candidates = self._candidates(cell, reach)
+                if len(candidates) >= k:
+                    cand_dist = np.hypot(*(scaled_centers[candidates] - point).T)
+                    nearest = np.argsort(cand_dist, kind='stable')[:k]
+                    # Centers outside the searched cells are at least this far away
+                    bound = reach * self.cell_size * scale.min()
+                    if cand_dist[nearest[-1]] <= bound or reach >= max_reach:
+                        break
+                reach += 1
+            found[idx] = candidates[nearest]
+            distances[idx] = cand_dist[nearest]
+        return self.fips_codes[found], distances
+
+    def within_radius(self, points, radius, map_size=None):
+        """
+        Given an (M, 2) array-like of points in a map of size map_size (defaults to the index map size)
+        and a radius in the same units,
+        Return a list with, for each point, an array of the FIPS codes of county centers within radius
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        scale = self._scale(map_size)
+        scaled_centers = self.centers * scale
+        reach = int(math.ceil(radius / (self.cell_size * scale.min())))
+        result = []
+        for point, cell in zip(points, self._cells(points / scale)):
+            candidates = self._candidates(cell, reach)
+            cand_dist = np.hypot(*(scaled_centers[candidates] - point).T)
+            result.append(self.fips_codes[np.sort(candidates[cand_dist <= radius])])
+        return result
+
+
+
+# Exact point-in-county lookup on the county boundaries, with a bounding-box R-tree prefilter
+
+class CountyPolygonIndex:
+    """
+    Packed R-tree over county bounding boxes supporting bulk point-in-county queries
+    Candidate counties from the tree are confirmed with an even-odd test against the edges
+    of every subpath of the boundary, so multi-subpath counties (islands, holes) are exact
+    """
+
+    def __init__(self, fips_codes, boundaries, map_size=USA_SVG_SIZE, node_size=16,
+                 edges_per_band=16, max_tests=1 << 22):
+        """
+        Given a list of FIPS codes and a matching list of (points, subpath starts) tuples
+        from get_boundary_array, in a map of size map_size ([width, height]), build the tree
+        Boundary edges of each county are bucketed into horizontal bands of about edges_per_band
+        edges, and at most max_tests point-edge pairs are tested at once
+        """
+        self.fips_codes = np.array(fips_codes, dtype=str)
+        self.max_tests = max_tests
+        self.map_size = np.asarray(map_size, dtype=float)
+        self.edges = []
+        self.bboxes = np.full((len(boundaries), 4), np.nan)
+        for idx, (points, starts) in enumerate(boundaries):
+            if not len(points):
+                self.edges.append(np.zeros((0, 4)))
+                continue
+            # Every subpath is closed on itself, as in compute_county_centers
+            ends = np.append(starts[1:], len(points)) - 1
+            following = np.arange(1, len(points) + 1)
+            following[ends] = starts
+            self.edges.append(np.column_stack([points, points[following]]))
+            self.bboxes[idx] = np.concatenate([points.min(axis=0), points.max(axis=0)])
+        self.bands = [self._edge_bands(edges, bbox, edges_per_band)
+                      for edges, bbox in zip(self.edges, self.bboxes)]
+
+        # Sort-tile-recursive packing, bottom up: each level is a tuple of node boxes
+        # and the [lo, hi) range of each node's children in the level below
+        self.levels = []
+        self.county_order = self._pack(self.bboxes, node_size)
+        boxes = self.bboxes[self.county_order]
+        while len(boxes):
+            lo = np.arange(0, len(boxes), node_size)
+            hi = np.minimum(lo + node_size, len(boxes))
+            node_boxes = np.column_stack([np.fmin.reduceat(boxes[:, :2], lo),
+                                          np.fmax.reduceat(boxes[:, 2:], lo)])
+            if len(node_boxes) == 1:
+                self.levels.append((node_boxes, lo, hi))
+                break
+            order = self._pack(node_boxes, node_size)
+            self.levels.append((node_boxes[order], lo[order], hi[order]))
+            boxes = node_boxes[order]
+        self.levels.reverse()
+
+    @classmethod
+    def from_svg(cls, svg_file_name, map_size=USA_SVG_SIZE):
+        """
+        Build the index from the county paths of an SVG file, as read by iter_county_attributes
+        Only paths whose id is a FIPS code are indexed
+        """
+        fips_codes = []
+        boundaries = []
+        for fips, boundary in iter_county_attributes(svg_file_name):
+            fips_codes.append(fips)
+            boundaries.append(get_boundary_array(boundary))
+        return cls(fips_codes, boundaries, map_size)
+
+    @staticmethod
+    def _edge_bands(edges, bbox, edges_per_band):
+        """
+        Given an (E, 4) array of edges and their bounding box, split the box into horizontal bands
+        Return a tuple of the edges, the start of each band in the band edge list, and the band
+        edge list: the indices of the edges crossing each band, band by band
+        """
+        num_bands = max(len(edges) // edges_per_band, 1)
+        if not len(edges):
+            return edges, np.zeros(2, dtype=int), np.zeros(0, dtype=int)
+        height = max(bbox[3] - bbox[1], 1e-12)
+        y_lo = np.minimum(edges[:, 1], edges[:, 3])
+        y_hi = np.maximum(edges[:, 1], edges[:, 3])
+        first = np.clip(((y_lo - bbox[1]) / height * num_bands).astype(int), 0, num_bands - 1)
+        last = np.clip(((y_hi - bbox[1]) / height * num_bands).astype(int), 0, num_bands - 1)
+        counts = last - first + 1
+        edge_idx = np.repeat(np.arange(len(edges)), counts)
+        band = np.repeat(first - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+        order = np.argsort(band, kind='stable')
+        band_starts = np.searchsorted(band[order], np.arange(num_bands + 1))
+        return edges, band_starts, edge_idx[order]
+
+    @staticmethod
+    def _pack(boxes, node_size):
+        """
+        Return the order of boxes for sort-tile-recursive packing: vertical slabs by x-center,
+        each sorted by y-center, so consecutive runs of node_size boxes are spatially compact
+        """
+        centers = 0.5 * (boxes[:, :2] + boxes[:, 2:])
+        num_slabs = int(math.ceil(math.sqrt(len(boxes) / node_size)))
+        slab_size = max(num_slabs * node_size, 1)
+        by_x = np.argsort(centers[:, 0], kind='stable')
+        slabs = [by_x[start:start + slab_size] for start in range(0, len(by_x), slab_size)]
+        if not slabs:
+            return by_x
+        return np.concatenate([slab[np.argsort(centers[slab, 1], kind='stable')] for slab in slabs])
+
+    def _candidate_points(self, points):
+        """
+        Given an (M, 2) array of points in index coordinates,
+        Return a dictionary mapping county indices to arrays of the points whose bounding boxes contain them
+        """
+        candidates = {}
+        leaf_boxes = self.bboxes[self.county_order]
+        stack = [(0, 0, np.arange(len(points)))]
+        while stack:
+            depth, node, point_idx = stack.pop()
+            _, lo, hi = self.levels[depth]
+            leaf = depth + 1 == len(self.levels)
+            boxes = leaf_boxes if leaf else self.levels[depth + 1][0]
+            pts = points[point_idx]
+            for child in range(lo[node], hi[node]):
+                box = boxes[child]
+                inside = point_idx[(box[0] <= pts[:, 0]) & (pts[:, 0] <= box[2]) &
+                                   (box[1] <= pts[:, 1]) & (pts[:, 1] <= box[3])]
+                if not len(inside):
+                    continue
+                if leaf:
+                    candidates[self.county_order[child]] = inside
+                else:
+                    stack.append((depth + 1, child, inside))
+        return candidates
+
+    @staticmethod
+    def _even_odd(points, edges):
+        """
+        Given an (M, 2) array of points and an (E, 4) array of edges (x1, y1, x2, y2),
+        Return a boolean array marking the points that cross an odd number of edges
+        on a ray to the right, i.e. lie inside the boundary by the even-odd rule
+        """
+        px = points[:, 0:1]
+        py = points[:, 1:2]
+        x1, y1, x2, y2 = edges.T
+        spans = (y1 > py) != (y2 > py)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cross_x = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+        return np.count_nonzero(spans & (px < cross_x), axis=1) % 2 == 1
+
+    def _inside_county(self, county, points):
+        """
+        Given a county index and an (M, 2) array of points inside its bounding box,
+        Return a boolean array marking the points inside the county
+        Each point is only tested against the edges in its horizontal band of the county
+        """
+        edges, band_starts, band_edges = self.bands[county]
+        y_min, y_max = self.bboxes[county, 1], self.bboxes[county, 3]
+        num_bands = len(band_starts) - 1
+        bands = np.clip(((points[:, 1] - y_min) / max(y_max - y_min, 1e-12) * num_bands).astype(int),
+                        0, num_bands - 1)
+        result = np.zeros(len(points), dtype=bool)
+        for band in np.unique(bands):
+            in_band = np.flatnonzero(bands == band)
+            band_edges_idx = band_edges[band_starts[band]:band_starts[band + 1]]
+            step = max(self.max_tests // max(len(band_edges_idx), 1), 1)
+            for chunk in range(0, len(in_band), step):
+                members = in_band[chunk:chunk + step]
+                result[members] = self._even_odd(points[members], edges[band_edges_idx])
+        return result
+
+    def locate(self, points, map_size=None, batch_size=1 << 20):
+        """
+        Given an (M, 2) array-like of points in a map of size map_size (defaults to the index map size),
+        Return an array with the FIPS code of the county containing each point, or '' for none
+        Points are processed batch_size at a time; on shared edges the first county listed wins
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if map_size is not None:
+            points = points * (self.map_size / np.asarray(map_size, dtype=float))
+        found = np.full(len(points), -1)
+        if not self.levels:
+            return np.full(len(points), '', dtype=self.fips_codes.dtype)
+        for batch_start in range(0, len(points), batch_size):
+            batch = points[batch_start:batch_start + batch_size]
+            candidates = self._candidate_points(batch)
+            for county in sorted(candidates):
+                point_idx = candidates[county] + batch_start
+                point_idx = point_idx[found[point_idx] < 0]
+                inside = self._inside_county(county, points[point_idx])
+                found[point_idx[inside]] = county
+        return np.where(found >= 0, self.fips_codes[found], '')
@@ -7,7 +7,13 @@ about the expected behavior of the program.
 """
 
 import csv
+import os
+from collections import OrderedDict
+import numpy
 import pygal
+from column_table import read_csv_as_column_table
+from gdp_store import open_gdp_store
+from render_cache import content_hash, render_if_changed
 
 #from pylab import plot, title, xlabel, ylabel, savefig, legend, array
 #from matplotlib import pyplot as plt
@@ -15,13 +21,14 @@ import pygal
 #import json
 
 
-def read_csv_as_nested_dict(filename, keyfield, separator, quote):
+def read_csv_as_nested_dict(filename, keyfield, separator, quote, columnar=False):
     """
     Inputs:
       filename  - Name of CSV file
       keyfield  - Field to use as key for rows
       separator - Character that separates fields
       quote     - Character used to optionally quote fields
+      columnar  - If True, return a ColumnTable keyed on keyfield instead
 
     Output:
       Returns a dictionary of dictionaries where the outer dictionary
@@ -29,6 +36,8 @@ def read_csv_as_nested_dict(filename, keyfield, separator, quote):
       CSV file.  The inner dictionaries map the field names to the
       field values for that row.
     """
+    if columnar:
+        return read_csv_as_column_table(filename, separator, quote, keyfield)
     table = {}
     with open(filename, newline='') as csvfile:
         csvreader = csv.DictReader(csvfile, delimiter=separator, quotechar=quote)
@@ -55,14 +64,18 @@ def build_plot_values(gdpinfo, gdpdata):
       exist in gdpdata.  The year will be an integer and the GDP will
       be a float.
     """
-    keysyrs=sorted(gdpdata.keys())
-    tuplist1=[(k, gdpdata[k]) for k in keysyrs if int(k)>= gdpinfo['min_year'] and 
-              int(k)<=gdpinfo['max_year']]
-    tuplist=[(int(k[0]),float(k[1])) for k in tuplist1 if k[1] != '']
-    tuplist=sorted(tuplist, key= lambda x:x[0])
+    years=[(int(key), val) for key, val in gdpdata.items()]
+    tuplist=[(year, float(val)) for year, val in years
+             if gdpinfo['min_year'] <= year <= gdpinfo['max_year'] and val != '']
+    tuplist.sort(key=lambda x: x[0])
     return tuplist
 
 
+# Plot values of recently plotted countries, most recently used last
+PLOT_VALUES_CACHE=OrderedDict()
+PLOT_VALUES_CACHE_SIZE=256
+
+
 def build_plot_dict(gdpinfo, country_list):
     """
     Inputs:
@@ -77,64 +90,107 @@ def build_plot_dict(gdpinfo, country_list):
       Countries from country_list that do not appear in the
       CSV file should still be in the output dictionary, but
       with an empty XY plot value list.
-    """
-    country_dict=read_csv_as_nested_dict(gdpinfo['gdpfile'], 
-                                         gdpinfo['country_name'] , 
-                                         gdpinfo['separator'],
-                                         gdpinfo['quote'])
 
-    key_yrs=list(range(gdpinfo['min_year'],(gdpinfo['max_year']+1)))
-
-    country_dict_yrs={}
-    
-    for country in country_dict:
-        country_dict_yrs[country]={k: country_dict[country][str(k)] for k in key_yrs}
+      The values come from the shared GDP store (see gdp_store) and
+      only the series of the countries in country_list are built.
+      They are kept in PLOT_VALUES_CACHE, keyed on the file (and its
+      modification time) and the year range, so plotting the same
+      countries again does no work.
+    """
+    stat=os.stat(gdpinfo['gdpfile'])
+    file_key=(os.path.abspath(gdpinfo['gdpfile']), stat.st_mtime_ns, stat.st_size,
+              gdpinfo['separator'], gdpinfo['quote'], gdpinfo['country_name'],
+              gdpinfo['min_year'], gdpinfo['max_year'])
+    wanted={country for country in country_list
+            if file_key + (country,) not in PLOT_VALUES_CACHE}
+
+    if wanted:
+        gdpdata=open_gdp_store(gdpinfo).by_name(gdpinfo['min_year'], gdpinfo['max_year'])
+        for country in wanted:
+            PLOT_VALUES_CACHE[file_key + (country,)]=gdpdata.series(country)
 
-    
-    plot_values={}
-    for country in country_dict_yrs:
-        plot_values[country]=build_plot_values(gdpinfo,country_dict_yrs[country])
-        
     plot_dict={}
     for country in country_list:
+        key=file_key + (country,)
+        PLOT_VALUES_CACHE.move_to_end(key)
+        plot_dict[country]=list(PLOT_VALUES_CACHE[key])
+    while len(PLOT_VALUES_CACHE) > max(PLOT_VALUES_CACHE_SIZE, len(country_list)):
+        PLOT_VALUES_CACHE.popitem(last=False)
+    return plot_dict
 
-        if country in country_dict_yrs.keys():
-            plot_dict[country]=plot_values[country]
 
-        else:
-            plot_dict[country]=[]
+# Most points drawn for a single country; longer series are downsampled
+MAX_PLOT_POINTS=500
 
-    return plot_dict
 
+def downsample_lttb(points, budget):
+    """
+    Inputs:
+      points - List of (x, y) tuples in increasing x order
+      budget - Largest number of points to keep (at least 3)
 
-def render_xy_plot(gdpinfo, country_list, plot_file):
+    Output:
+      Returns a list of at most budget of the points, chosen with the
+      largest-triangle-three-buckets method: the first and last points
+      are kept, and the others are split into buckets of equal size,
+      keeping from each bucket the point forming the largest triangle
+      with the point kept before it and the average of the next bucket.
+      Points are returned unchanged if there are no more than budget.
+    """
+    if budget >= len(points) or budget < 3:
+        return list(points)
+    data=numpy.asarray(points, dtype=float)
+    edges=numpy.linspace(1, len(points) - 1, budget - 1).astype(int)
+    kept=[0]
+    for bucket in range(budget - 2):
+        start, stop=edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            following=data[stop:edges[bucket + 2]].mean(axis=0)
+        else:
+            following=data[-1]
+        prev=data[kept[-1]]
+        candidates=data[start:stop]
+        # Twice the triangle area, which ranks candidates the same way
+        areas=numpy.abs((prev[0] - following[0]) * (candidates[:, 1] - prev[1]) -
+                        (prev[0] - candidates[:, 0]) * (following[1] - prev[1]))
+        kept.append(start + int(numpy.argmax(areas)))
+    kept.append(len(points) - 1)
+    return [points[idx] for idx in kept]
+
+
+def render_xy_plot(gdpinfo, country_list, plot_file, max_points=MAX_PLOT_POINTS):
     """
     Inputs:
       gdpinfo      - GDP data information dictionary
       country_list - List of strings that are country names
       plot_file    - String that is the output plot file name
+      max_points   - Largest number of points drawn for one country;
+                     longer series are downsampled (see downsample_lttb)
 
     Output:
       Returns None.
 
     Action:
       Creates an SVG image of an XY plot for the GDP data
-      specified by gdpinfo for the countries in country_list.
-      The image will be stored in a file named by plot_file.
+      specified by gdpinfo for the countries in country_list, with
+      one series per country.
+      The image will be stored in a file named by plot_file, unless
+      the file already holds the same plot (see render_cache).
     """
     plot_dict=build_plot_dict(gdpinfo, country_list)
-    for country in country_list:
+    title='GDP DATA'
+    series=[(country, downsample_lttb(plot_dict[country], max_points))
+            for country in country_list]
+    digest=content_hash(series, {"chart": "XY", "title": title})
+
+    def render():
         xy_chart=pygal.XY()
-        xy_chart.title='GDP DATA'
-        xy_chart.add(country, *zip(*plot_dict[country]))
-    xy_chart.render()
-    xy_chart.render_to_file(plot_file)
-    
-#        plt.plot(*zip(*plot_dict[country]),label=country)
-#        plt.xlabel('Years')
-#        plt.ylabel('GDP in current US Dollars')
+        xy_chart.title=title
+        for country, values in series:
+            xy_chart.add(country, values)
+        return xy_chart.render()
 
-#    plt.savefig(plot_file)
+    render_if_changed(render, plot_file, digest)
     return
 
 
@@ -3,19 +3,26 @@ Project for Week 3 of "Python Data Visualization".
 Unify data via common country name.
 """
 import csv
-import math
 import pygal
+from column_table import read_csv_as_column_table
+from gdp_store import open_gdp_store
+from name_match import NameIndex
+from world_maps import render_map_file, render_map_files
+
+# Fuzzy country name matches saved between runs
+NAME_MATCH_FILE = 'country_name_matches.json'
 
 
 #import pygal.maps.world
 
-def read_csv_as_nested_dict(filename, keyfield, separator, quote):
+def read_csv_as_nested_dict(filename, keyfield, separator, quote, columnar=False):
     """
     Inputs:
       filename  - Name of CSV file
       keyfield  - Field to use as key for rows
       separator - Character that separates fields
       quote     - Character used to optionally quote fields
+      columnar  - If True, return a ColumnTable keyed on keyfield instead
 
     Output:
       Returns a dictionary of dictionaries where the outer dictionary
@@ -23,6 +30,8 @@ def read_csv_as_nested_dict(filename, keyfield, separator, quote):
       CSV file.  The inner dictionaries map the field names to the
       field values for that row.
     """
+    if columnar:
+        return read_csv_as_column_table(filename, separator, quote, keyfield)
     table = {}
     with open(filename, newline='') as csvfile:
         csvreader = csv.DictReader(csvfile, delimiter=separator, quotechar=quote)
@@ -53,12 +62,14 @@ def build_plot_values(gdpinfo, gdpdata):
     tuplist=[(int(k[0]),float(k[1])) for k in tuplist1 if k[1] != '']
     return tuplist
 
-def reconcile_countries_by_name(plot_countries, gdp_countries):
+def reconcile_countries_by_name(plot_countries, gdp_countries, fuzzy=False):
     """
     Inputs:
       plot_countries - Dictionary whose keys are plot library country codes
                        and values are the corresponding country name
       gdp_countries  - Dictionary whose keys are country names used in GDP data
+      fuzzy          - If True, also match names spelled differently
+                       (see name_match), saving matches in NAME_MATCH_FILE
 
     Output:
       A tuple containing a dictionary and a set.  The dictionary maps
@@ -66,6 +77,12 @@ def reconcile_countries_by_name(plot_countries, gdp_countries):
       gdp_countries The set contains the country codes from
       plot_countries that were not found in gdp_countries.
     """
+    if fuzzy:
+        matches=NameIndex(gdp_countries).match_all(plot_countries.values(),
+                                                   cache_file=NAME_MATCH_FILE)
+        rec_plots={ccode: matches[name] for ccode, name in plot_countries.items()
+                   if matches[name] is not None}
+        return rec_plots, set(plot_countries)-set(rec_plots)
     rec_plots={}
     plot_set=set()
     for ccode in plot_countries:
@@ -76,13 +93,15 @@ def reconcile_countries_by_name(plot_countries, gdp_countries):
     return rec_plots, plot_set
 
 
-def build_map_dict_by_name(gdpinfo, plot_countries, year):
+def build_map_dict_by_name(gdpinfo, plot_countries, year, fuzzy=False):
     """
     Inputs:
       gdpinfo        - A GDP information dictionary
       plot_countries - Dictionary whose keys are plot library country codes
                        and values are the corresponding country name
       year           - String year to create GDP mapping for
+      fuzzy          - If True, reconcile names fuzzily (see
+                       reconcile_countries_by_name)
 
     Output:
       A tuple containing a dictionary and two sets.  The dictionary
@@ -93,31 +112,10 @@ def build_map_dict_by_name(gdpinfo, plot_countries, year):
       codes from plot_countries that were found in the GDP data file, but
       have no GDP data for the specified year.
     """
-    cc_gdp={}
-    set1=set()
-    set2=set()
-    
-    gdpdata1=read_csv_as_nested_dict(gdpinfo['gdpfile'], gdpinfo['country_name'],
-                            gdpinfo['separator'],gdpinfo['quote'])
-    key_yrs=list(range(gdpinfo['min_year'],(gdpinfo['max_year']+1)))
-    gdpdata={}    
-    for country in gdpdata1:
-        gdpdata[country]={k: gdpdata1[country][str(k)] for k in key_yrs}
-#    print(gdpdata)
-        
-    rec_plots,plot_set=reconcile_countries_by_name(plot_countries, gdpdata)
-    
-    for ccode in plot_countries:
-        if plot_countries[ccode] in gdpdata:
-            if gdpdata[rec_plots[ccode]][int(year)] != '':
-                cc_gdp[ccode]=math.log10(float(gdpdata[rec_plots[ccode]][int(year)]))
-            else:
-                set1.add(ccode)
-        else:
-            set2.add(ccode)
-            
-    
-    return cc_gdp, set2, set1
+    gdpdata=open_gdp_store(gdpinfo).by_name(gdpinfo['min_year'], gdpinfo['max_year'])
+    rec_plots,plot_set=reconcile_countries_by_name(plot_countries, gdpdata, fuzzy)
+    cc_gdp,set1=gdpdata.map_dict(rec_plots, year)
+    return cc_gdp, plot_set, set1
 
 
 def render_world_map(gdpinfo, plot_countries, year, map_file):
@@ -137,18 +135,60 @@ def render_world_map(gdpinfo, plot_countries, year, map_file):
       writes it to a file named by map_file.
     """
     cc_gdp, set1, set2=build_map_dict_by_name(gdpinfo, plot_countries, year)
-    worldmap_chart = pygal.maps.world.World()
-    worldmap_chart.title="GDP of Countries in Log scale"
-    worldmap_chart.add(year,cc_gdp )
-    worldmap_chart.add("Missing From World Bank Data",set1)
-    worldmap_chart.add("GDP Data Missing",set2)
-    worldmap_chart.render()
-    worldmap_chart.render_to_file(map_file)
-    
-
+    render_map_file(year, cc_gdp, set1, set2, map_file)
     return
 
 
+def build_map_dicts_by_name(gdpinfo, plot_countries, years, fuzzy=False):
+    """
+    Inputs:
+      gdpinfo        - A GDP information dictionary
+      plot_countries - Dictionary whose keys are plot library country codes
+                       and values are the corresponding country name
+      years          - List of string years to create GDP mappings for
+      fuzzy          - If True, reconcile names fuzzily (see
+                       reconcile_countries_by_name)
+
+    Output:
+      A dictionary mapping each year in years to the same tuple that
+      build_map_dict_by_name returns for that year.  The countries are
+      reconciled once and the GDP values for every year are converted
+      to log (base 10) once (see gdp_store.GdpMatrix).
+    """
+    gdpdata=open_gdp_store(gdpinfo).by_name(gdpinfo['min_year'], gdpinfo['max_year'])
+    rec_plots,plot_set=reconcile_countries_by_name(plot_countries, gdpdata, fuzzy)
+    map_dicts=gdpdata.map_dicts(rec_plots, years)
+    return {year: (cc_gdp, set(plot_set), set1)
+            for year, (cc_gdp, set1) in map_dicts.items()}
+
+
+def render_world_maps(gdpinfo, plot_countries, years, map_pattern, workers=None,
+                      fuzzy=False):
+    """
+    Inputs:
+      gdpinfo        - A GDP information dictionary
+      plot_countries - Dictionary whose keys are plot library country codes
+                       and values are the corresponding country name
+      years          - List of string years to create maps for
+      map_pattern    - Output file name containing "{year}", which is
+                       replaced by each year
+      workers        - Number of worker processes used for rendering
+                       (None uses one per CPU, 1 renders in this process)
+      fuzzy          - If True, reconcile names fuzzily (see
+                       reconcile_countries_by_name)
+
+    Output:
+      Returns a list of the map files written, in the order of years.
+
+    Action:
+      Creates one world map plot per year, as render_world_map does,
+      but parses and reconciles the data once and renders the SVG
+      files in parallel.
+    """
+    map_dicts=build_map_dicts_by_name(gdpinfo, plot_countries, years, fuzzy)
+    return render_map_files(map_dicts, years, map_pattern, workers)
+
+
 def test_render_world_map():
     """
     Test the project code for several years.
@@ -184,7 +224,7 @@ def test_render_world_map():
 
 #test_render_world_map()
 
-build_plot_dict({'gdpfile': 'gdptable3.csv', 'max_year': 20017, 
-                 'country_name': 'ID', 'quote': "'", 
-                 'country_code': 'CC', 'separator': ';', 'min_year': 20010}, 
-                    ['A 5 '])
\ No newline at end of file
+#build_plot_dict({'gdpfile': 'gdptable3.csv', 'max_year': 20017, 
+#                 'country_name': 'ID', 'quote': "'", 
+#                 'country_code': 'CC', 'separator': ';', 'min_year': 20010}, 
+#                    ['A 5 '])
\ No newline at end of file
@@ -7,48 +7,203 @@ about the expected behavior of the program.
 """
 
 import csv
-import math
 import pygal
+from column_table import read_csv_as_column_table
+from csv_cache import CsvLoadCache
+from gdp_store import open_gdp_store
+from world_maps import render_map_file, render_map_files
 #import pygal.maps.world
 
-def read_csv_as_nested_dict(filename, keyfield, separator, quote):
+# Parsed CSV files shared between calls, e.g. one render per year
+CSV_CACHE = CsvLoadCache()
+
+# Fields tried as the key field when the file has no field named like it
+KEYFIELD_SYNONYMS = ('Country', 'Country Name')
+
+# Key field resolved for each (header, key field, synonyms)
+_KEYFIELD_CACHE = {}
+
+
+def resolve_keyfield(fieldnames, keyfield, synonyms=KEYFIELD_SYNONYMS):
+    """
+    Inputs:
+      fieldnames - List of field names of a CSV file
+      keyfield   - Field asked for as key
+      synonyms   - Fields to try in turn if keyfield is not found
+
+    Output:
+      Returns the field name of fieldnames to key rows on, or None if
+      there is none: keyfield itself, else the field equal to it
+      ignoring case, else the first synonym found the same way.
+      Resolutions are cached per header.
+    """
+    cache_key = (tuple(fieldnames), keyfield, tuple(synonyms))
+    if cache_key not in _KEYFIELD_CACHE:
+        folded = {}
+        for field in fieldnames:
+            folded.setdefault(field.casefold(), field)
+        resolved = None
+        for candidate in (keyfield,) + tuple(synonyms):
+            if candidate in fieldnames:
+                resolved = candidate
+            else:
+                resolved = folded.get(candidate.casefold())
+            if resolved is not None:
+                break
+        _KEYFIELD_CACHE[cache_key] = resolved
+    return _KEYFIELD_CACHE[cache_key]
+
+
+def read_csv_as_nested_dict(filename, keyfield, separator, quote, columnar=False,
+                            synonyms=KEYFIELD_SYNONYMS):
     """
     Inputs:
       filename  - Name of CSV file
       keyfield  - Field to use as key for rows
       separator - Character that separates fields
       quote     - Character used to optionally quote fields
+      columnar  - If True, return a ColumnTable keyed on keyfield instead
+      synonyms  - Fields to key on if the file has no keyfield (see
+                  resolve_keyfield)
 
     Output:
       Returns a dictionary of dictionaries where the outer dictionary
       maps the value in the key_field to the corresponding row in the
       CSV file.  The inner dictionaries map the field names to the
-      field values for that row.
+      field values for that row.  Returns an empty dictionary if no
+      key field is found.
     """
+    if columnar:
+        with open(filename, newline='') as csvfile:
+            fieldnames = next(csv.reader(csvfile, delimiter=separator, quotechar=quote), [])
+        field = resolve_keyfield(fieldnames, keyfield, synonyms)
+        if field is None:
+            return {}
+        return read_csv_as_column_table(filename, separator, quote, field)
     table = {}
     
     with open(filename, newline='') as csvfile:
         csvreader = csv.DictReader(csvfile, delimiter=separator, quotechar=quote)
+        field = resolve_keyfield(csvreader.fieldnames or [], keyfield, synonyms)
+        if field is None:
+            return table
         for row in csvreader:
-            if keyfield.capitalize() in row:
-                
-                rowid = row[keyfield.capitalize()]
-                table[rowid] = row
-            elif keyfield.lower() in row:
-                rowid = row[keyfield.lower()]
-                table[rowid] = row
-            elif keyfield.upper() in row:
-                rowid = row[keyfield.upper()]
-                table[rowid] = row
-            elif 'Country' in row:
-                rowid = row['Country']
-                table[rowid] = row
-            elif 'Country Name' in row:
-                rowid = row['Country Name']
-                table[rowid] = row
+            table[row[field]] = row
     
     return table
 
+def _code_key(code):
+    """
+    Returns the key codes are compared by: casefolded, and without
+    leading zeros for numeric codes (so '4' matches '004').
+    """
+    code=code.strip().casefold()
+    if code.isdigit():
+        return code.lstrip('0') or '0'
+    return code
+
+
+class CountryCodeResolver:
+    """
+    Case-insensitive translation between the code columns of a country
+    code file (such as ISO3166-1-Alpha-2, ISO3166-1-Alpha-3,
+    ISO3166-1-numeric, FIPS or IOC).
+
+    The lookup table for each pair of columns is built the first time
+    it is used and kept, so translating a batch of codes is one
+    dictionary lookup per code.
+    """
+
+    def __init__(self, fieldnames, rows):
+        self.fieldnames=list(fieldnames)
+        self.columns={field: [row[col] if col < len(row) else '' for row in rows]
+                      for col, field in enumerate(self.fieldnames)}
+        self._tables={}
+
+    def table(self, from_field, to_field):
+        """
+        Returns a dictionary mapping the compare key (see _code_key) of
+        every code in from_field to the code in to_field of the same
+        country.  Rows with an empty code in either field are skipped;
+        when a code appears twice, the last row wins.
+        """
+        pair=(from_field, to_field)
+        if pair not in self._tables:
+            self._tables[pair]={_code_key(src): dst for src, dst in
+                                zip(self.columns[from_field], self.columns[to_field])
+                                if src.strip() and dst.strip()}
+        return self._tables[pair]
+
+    def converter(self, from_field, to_field):
+        """
+        Returns a dictionary mapping every code in from_field, with its
+        case in the file, to the code in to_field of the same country.
+        """
+        return {src: dst for src, dst in zip(self.columns[from_field], self.columns[to_field])
+                if src.strip() and dst.strip()}
+
+    def map_codes(self, codes, from_field, to_field, targets=None):
+        """
+        Inputs:
+          codes      - Iterable of codes from from_field, in any case
+          from_field - Code column the codes come from
+          to_field   - Code column to translate them to
+          targets    - Optional collection of to_field codes (such as the
+                       keys of the GDP data) the results must be in
+
+        Output:
+          A tuple of a dictionary and a set.  The dictionary maps each
+          code, with its case unchanged, to its translation: the code
+          as spelled in targets when targets is given, otherwise as in
+          the code file.  The set holds the codes that have no
+          translation (or none in targets).
+        """
+        table=self.table(from_field, to_field)
+        if targets is not None:
+            spelled={_code_key(target): target for target in targets}
+            table={key: spelled[_code_key(dst)] for key, dst in table.items()
+                   if _code_key(dst) in spelled}
+        mapped={}
+        unmatched=set()
+        for code in codes:
+            dst=table.get(_code_key(code))
+            if dst is None:
+                unmatched.add(code)
+            else:
+                mapped[code]=dst
+        return mapped, unmatched
+
+
+def read_country_code_resolver(filename, keyfield, separator, quote):
+    """
+    Inputs:
+      filename  - Name of country code file
+      keyfield  - Unused; present to match the CsvLoadCache loaders
+      separator - Character that separates fields
+      quote     - Character used to optionally quote fields
+
+    Output:
+      Returns a CountryCodeResolver for every code column in the file.
+    """
+    with open(filename, newline='') as csvfile:
+        csvreader=csv.reader(csvfile, delimiter=separator, quotechar=quote)
+        fieldnames=next(csvreader, [])
+        return CountryCodeResolver(fieldnames, [row for row in csvreader if row])
+
+
+def load_country_code_resolver(codeinfo):
+    """
+    Inputs:
+      codeinfo - A country code information dictionary
+
+    Output:
+      Returns the CountryCodeResolver of the code file in codeinfo,
+      reading the file only if it has changed since it was last read.
+    """
+    return CSV_CACHE.load(read_country_code_resolver, codeinfo['codefile'], None,
+                           codeinfo['separator'], codeinfo['quote'])
+
+
 def build_country_code_converter(codeinfo):
     """
     Inputs:
@@ -59,15 +214,8 @@ def build_country_code_converter(codeinfo):
       are world bank country codes, where the code fields in the
       code file are specified in codeinfo.
     """
-    table=read_csv_as_nested_dict(codeinfo['codefile'],
-                                  'name',
-                                  codeinfo['separator'],
-                                  codeinfo['quote'])
-    plot_to_gdp={}
-    for country in table:
-        plot_to_gdp[table[country][codeinfo['plot_codes']]]=table[country][codeinfo['data_codes']]
-#    print(plot_to_gdp)
-    return plot_to_gdp
+    resolver=load_country_code_resolver(codeinfo)
+    return resolver.converter(codeinfo['plot_codes'], codeinfo['data_codes'])
 
 
 def reconcile_countries_by_code(codeinfo, plot_countries, gdp_countries):
@@ -90,49 +238,9 @@ def reconcile_countries_by_code(codeinfo, plot_countries, gdp_countries):
       the codes with the exact same case as they have in
       plot_countries and gdp_countries.
     """
-    rec_plots={}
-    plot_set=set()
-    conv_plot_gdpc=build_country_code_converter(codeinfo)
-    
-#    plot_countries =  {k.upper(): v for k, v in plot_countries.items()}
-    for ccode in plot_countries:
-        if ccode.upper() in plot_countries:
-            
-            if ccode.upper() in conv_plot_gdpc:
-                ccode=ccode.upper()
-                if conv_plot_gdpc[ccode] in gdp_countries:
-                    rec_plots[ccode]=conv_plot_gdpc[ccode]
-                else:
-                    plot_set.add(ccode.upper())
-            elif ccode.lower() in conv_plot_gdpc:
-                ccode=ccode.lower()
-                if conv_plot_gdpc[ccode] in gdp_countries:
-                    rec_plots[ccode]=conv_plot_gdpc[ccode]
-                else:
-                    plot_set.add(ccode.upper())
-            else:
-                plot_set.add(ccode.upper())
-            rec_plots =  {k.upper(): v for k, v in rec_plots.items()}
-        elif ccode.lower() in plot_countries:
-            
-            if ccode.upper() in conv_plot_gdpc:
-                ccode=ccode.upper()
-                if conv_plot_gdpc[ccode] in gdp_countries:
-                    rec_plots[ccode]=conv_plot_gdpc[ccode]
-                else:
-                    plot_set.add(ccode.lower())
-            elif ccode.lower() in conv_plot_gdpc:
-                ccode=ccode.lower()
-                if conv_plot_gdpc[ccode] in gdp_countries:
-                    rec_plots[ccode]=conv_plot_gdpc[ccode]
-                else:
-                    plot_set.add(ccode.lower())
-            else:
-                plot_set.add(ccode.lower())
-            rec_plots =  {k.lower(): v for k, v in rec_plots.items()}
-        
-#    print(rec_plots,plot_set)
-    return rec_plots, plot_set
+    resolver=load_country_code_resolver(codeinfo)
+    return resolver.map_codes(plot_countries, codeinfo['plot_codes'],
+                              codeinfo['data_codes'], gdp_countries)
 
 
 def build_map_dict_by_code(gdpinfo, codeinfo, plot_countries, year):
@@ -152,56 +260,9 @@ def build_map_dict_by_code(gdpinfo, codeinfo, plot_countries, year):
       codes from plot_countries that were found in the GDP data file, but
       have no GDP data for the specified year.
     """
-    cc_gdp={}
-    set1=set()
-    set2=set()
-    
-    gdpdata1=read_csv_as_nested_dict(gdpinfo['gdpfile'], gdpinfo['country_code'],
-                            gdpinfo['separator'],gdpinfo['quote'])
-    key_yrs=list(range(gdpinfo['min_year'],(gdpinfo['max_year']+1)))
-    gdpdata={}    
-    for ccode in gdpdata1:
-        gdpdata[ccode]={k: gdpdata1[ccode][str(k)] for k in key_yrs}
-#    print(gdpdata)
-        
+    gdpdata=open_gdp_store(gdpinfo).by_code(gdpinfo['min_year'], gdpinfo['max_year'])
     rec_plots,plot_set=reconcile_countries_by_code(codeinfo, plot_countries, gdpdata)
-    conv_plot_gdpc=build_country_code_converter(codeinfo)
-#    plot_countries =  {k.upper(): v for k, v in plot_countries.items()}
-    for ccode in plot_countries:
-        if ccode.lower() in plot_countries:
-#            print('entered lower plot')
-            ccode=ccode.lower()
-            if conv_plot_gdpc[ccode] in gdpdata:
-                ccode=ccode.lower()
-                if gdpdata[rec_plots[ccode]][int(year)] != '':
-                    cc_gdp[ccode]=math.log10(float(gdpdata[rec_plots[ccode]][int(year)]))
-                    print(cc_gdp)
-                else:
-                    set1.add(ccode.lower())
-#        ccode=ccode.lower()
-        elif ccode.upper() in plot_countries:
-#            print('entered upper plot')
-            if ccode.upper() in conv_plot_gdpc:
-                ccode=ccode.upper()
-                if conv_plot_gdpc[ccode] in gdpdata:
-    #                ccode=ccode.lower()
-                    if gdpdata[rec_plots[ccode]][int(year)] != '':
-                        cc_gdp[ccode]=math.log10(float(gdpdata[rec_plots[ccode]][int(year)]))
-                        print(cc_gdp)
-                    else:
-                        set1.add(ccode.upper())
-            elif ccode.lower() in conv_plot_gdpc:
-                ccode=ccode.lower()
-                if conv_plot_gdpc[ccode] in gdpdata:
-                    ccode=ccode.upper()
-                    if gdpdata[rec_plots[ccode]][int(year)] != '':
-                        cc_gdp[ccode]=math.log10(float(gdpdata[rec_plots[ccode]][int(year)]))
-                        print(cc_gdp)
-                    else:
-                        set1.add(ccode.lower())
-        else:
-            set2.add(ccode)
-#    print(cc_gdp, plot_set, set1)
+    cc_gdp,set1=gdpdata.map_dict(rec_plots, year)
     return cc_gdp, plot_set, set1
 
 
@@ -222,16 +283,55 @@ def render_world_map(gdpinfo, codeinfo, plot_countries, year, map_file):
       it to a file named by svg_filename.
     """
     cc_gdp, set1, set2=build_map_dict_by_code(gdpinfo, codeinfo, plot_countries, year)
-    worldmap_chart = pygal.maps.world.World()
-    worldmap_chart.title="GDP of Countries in Log scale"
-    worldmap_chart.add(year,cc_gdp )
-    worldmap_chart.add("Missing From World Bank Data",set1)
-    worldmap_chart.add("GDP Data Missing",set2)
-    worldmap_chart.render()
-    worldmap_chart.render_to_file(map_file)
+    render_map_file(year, cc_gdp, set1, set2, map_file)
     return
 
 
+def build_map_dicts_by_code(gdpinfo, codeinfo, plot_countries, years):
+    """
+    Inputs:
+      gdpinfo        - A GDP information dictionary
+      codeinfo       - A country code information dictionary
+      plot_countries - Dictionary mapping plot library country codes to country names
+      years          - List of string years for which to create GDP mappings
+
+    Output:
+      A dictionary mapping each year in years to the same tuple that
+      build_map_dict_by_code returns for that year.  The country codes
+      are reconciled once and the GDP values for every year are
+      converted to log (base 10) once (see gdp_store.GdpMatrix).
+    """
+    gdpdata=open_gdp_store(gdpinfo).by_code(gdpinfo['min_year'], gdpinfo['max_year'])
+    rec_plots,plot_set=reconcile_countries_by_code(codeinfo, plot_countries, gdpdata)
+    map_dicts=gdpdata.map_dicts(rec_plots, years)
+    return {year: (cc_gdp, set(plot_set), set1)
+            for year, (cc_gdp, set1) in map_dicts.items()}
+
+
+def render_world_maps(gdpinfo, codeinfo, plot_countries, years, map_pattern, workers=None):
+    """
+    Inputs:
+      gdpinfo        - A GDP information dictionary
+      codeinfo       - A country code information dictionary
+      plot_countries - Dictionary mapping plot library country codes to country names
+      years          - List of string years of data
+      map_pattern    - Output file name containing "{year}", which is
+                       replaced by each year
+      workers        - Number of worker processes used for rendering
+                       (None uses one per CPU, 1 renders in this process)
+
+    Output:
+      Returns a list of the map files written, in the order of years.
+
+    Action:
+      Creates one world map plot per year, as render_world_map does,
+      but parses and reconciles the data once and renders the SVG
+      files in parallel.
+    """
+    map_dicts=build_map_dicts_by_code(gdpinfo, codeinfo, plot_countries, years)
+    return render_map_files(map_dicts, years, map_pattern, workers)
+
+
 def test_render_world_map():
     """
     Test the project code for several years
@@ -0,0 +1,231 @@
+"""
+Columnar tables for CSV files.
+
+A ColumnTable keeps each field of a CSV file as a single column instead
+of building one dictionary per row.  Fields whose values are all
+integers are stored in array('q') columns, fields whose values are all
+floats are stored in array('d') columns and every other field is stored
+as a list of interned strings.
+"""
+
+import array
+import csv
+import sys
+from collections.abc import Mapping
+
+
+def _interned_column(values):
+    """
+    Returns values as a list with every string interned.
+    """
+    return [sys.intern(val) if isinstance(val, str) else val for val in values]
+
+
+def _typed_column(values):
+    """
+    Inputs:
+      values - list of field values (strings, or None for missing fields)
+    Output:
+      Returns the most compact column holding values: an array('q') if
+      every value is an integer, an array('d') if every value is a
+      float, otherwise the list of strings with duplicates interned.
+      Integer text that would not survive the conversion unchanged,
+      such as zero-padded codes, stays as strings.
+    """
+    try:
+        ints = [int(val) for val in values]
+    except (TypeError, ValueError):
+        ints = None
+    if ints is not None:
+        if all(str(num) == val for num, val in zip(ints, values)):
+            try:
+                return array.array('q', ints)
+            except OverflowError:
+                pass
+        return _interned_column(values)
+    try:
+        return array.array('d', [float(val) for val in values])
+    except (TypeError, ValueError):
+        pass
+    return _interned_column(values)
+
+
+class RowView(Mapping):
+    """
+    Read-only dictionary view of a single row of a ColumnTable.
+
+    Formulas written against row dictionaries (row[field]) work
+    unchanged on a RowView, but no dictionary is allocated per row.
+    """
+
+    __slots__ = ('_table', '_idx')
+
+    def __init__(self, table, idx):
+        self._table = table
+        self._idx = idx
+
+    def __getitem__(self, field):
+        return self._table.columns[field][self._idx]
+
+    def __iter__(self):
+        return iter(self._table.columns)
+
+    def __len__(self):
+        return len(self._table.columns)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class ColumnTable:
+    """
+    Table of CSV data stored column by column.
+
+    columns maps each field name to a column sequence of equal length.
+    When keyfield is given, rows can also be looked up by the value in
+    that field, as with the nested dictionary readers.
+    """
+
+    def __init__(self, fieldnames, columns, keyfield=None):
+        self.fieldnames = list(fieldnames)
+        self.columns = columns
+        self.keyfield = keyfield
+        self._key_index = None
+
+    def __len__(self):
+        if not self.columns:
+            return 0
+        return len(next(iter(self.columns.values())))
+
+    def __iter__(self):
+        return self.rows()
+
+    def column(self, field):
+        """
+        Returns the column for the given field name.
+        """
+        return self.columns[field]
+
+    def row(self, idx):
+        """
+        Returns a RowView of the row at position idx.
+        """
+        return RowView(self, idx)
+
+    def rows(self):
+        """
+        Generator yielding a RowView for every row in order.
+        """
+        for idx in range(len(self)):
+            yield RowView(self, idx)
+
+    def take(self, indices):
+        """
+        Inputs:
+          indices - iterable of row positions
+        Output:
+          Returns a new ColumnTable holding only the given rows, in the
+          given order.  Typed columns stay typed.
+        """
+        indices = list(indices)
+        columns = {}
+        for field, col in self.columns.items():
+            if isinstance(col, array.array):
+                columns[field] = array.array(col.typecode, [col[idx] for idx in indices])
+            elif isinstance(col, memoryview):
+                columns[field] = array.array(col.format, [col[idx] for idx in indices])
+            else:
+                columns[field] = [col[idx] for idx in indices]
+        return ColumnTable(self.fieldnames, columns, self.keyfield)
+
+    def key_index(self):
+        """
+        Returns a dictionary mapping each value of keyfield to the
+        position of the last row holding that value.
+        """
+        if self._key_index is None:
+            keys = self.columns[self.keyfield]
+            self._key_index = {key: idx for idx, key in enumerate(keys)}
+        return self._key_index
+
+    def __contains__(self, key):
+        return key in self.key_index()
+
+    def __getitem__(self, key):
+        return RowView(self, self.key_index()[key])
+
+    def keys(self):
+        """
+        Returns the key values of the table, as for a nested dictionary.
+        """
+        return self.key_index().keys()
+
+    def to_list_dict(self):
+        """
+        Returns the table as a list of row dictionaries.
+        """
+        return [dict(row) for row in self.rows()]
+
+    def to_nested_dict(self):
+        """
+        Returns the table as a dictionary of row dictionaries keyed on
+        keyfield.
+        """
+        return {key: dict(self.row(idx)) for key, idx in self.key_index().items()}
+
+
+def column_table_from_rows(fieldnames, rows, keyfield=None):
+    """
+    Inputs:
+      fieldnames - list of field names
+      rows       - iterable of lists of field values
+      keyfield   - optional field to index rows by
+    Output:
+      Returns a ColumnTable built from rows.  Rows shorter than
+      fieldnames are padded with None and values beyond the last field
+      are dropped.  The key column is always kept as strings so lookups
+      match the nested dictionary readers.
+    """
+    numfields = len(fieldnames)
+    values = [[] for _ in range(numfields)]
+    # Share repeated values within each column while loading
+    seen = [{} for _ in range(numfields)]
+    for row in rows:
+        if not row:
+            continue
+        for col, known, val in zip(values, seen, row):
+            col.append(known.setdefault(val, val))
+        for col in values[len(row):]:
+            col.append(None)
+    del seen
+    columns = {}
+    for field, col in zip(fieldnames, values):
+        if field == keyfield:
+            columns[field] = _interned_column(col)
+        else:
+            columns[field] = _typed_column(col)
+    return ColumnTable(fieldnames, columns, keyfield)
+
+
+def read_csv_as_column_table(filename, separator, quote, keyfield=None):
+    """
+    Inputs:
+      filename  - name of CSV file
+      separator - character that separates fields
+      quote     - character used to optionally quote fields
+      keyfield  - optional field to use as key for rows
+    Output:
+      Returns a ColumnTable holding the contents of the CSV file.  If
+      the file has a current snapshot (see csv_snapshot), the table is
+      mapped from the snapshot instead of parsing the file.
+    """
+    # Imported here because csv_snapshot builds on this module
+    from csv_snapshot import open_current_snapshot
+    snapshot = open_current_snapshot(filename, separator, quote)
+    if snapshot is not None:
+        return snapshot.to_column_table(keyfield)
+
+    with open(filename, newline='') as csvfile:
+        csvreader = csv.reader(csvfile, delimiter=separator, quotechar=quote)
+        fieldnames = next(csvreader, [])
+        return column_table_from_rows(fieldnames, csvreader, keyfield)
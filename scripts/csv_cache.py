@@ -0,0 +1,84 @@
+"""
+Cache of parsed CSV files.
+
+Repeated calls that read the same CSV file with the same settings (for
+example rendering one world map per year) can share a single parse.
+Entries are keyed on the file's path, modification time and size
+together with the reader settings, so an edited file is parsed again.
+"""
+
+import os
+from collections import OrderedDict
+
+
+class CsvLoadCache:
+    """
+    Least recently used cache of parsed CSV tables.
+
+    The cache holds at most max_entries tables and at most max_bytes
+    of source file data.  The tables it returns are shared between
+    callers and must not be modified.
+    """
+
+    def __init__(self, max_entries=16, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def load(self, loader, filename, keyfield, separator, quote):
+        """
+        Inputs:
+          loader    - function called as loader(filename, keyfield,
+                      separator, quote) to parse the file on a miss
+          filename  - name of CSV file
+          keyfield  - field to use as key for rows
+          separator - character that separates fields
+          quote     - character used to optionally quote fields
+        Output:
+          Returns the table produced by loader, parsing the file only
+          if it is not already cached.
+        """
+        stat = os.stat(filename)
+        key = (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size,
+               separator, quote, keyfield)
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+        self.misses += 1
+        table = loader(filename, keyfield, separator, quote)
+        self._entries[key] = (table, stat.st_size)
+        self._bytes += stat.st_size
+        self._evict()
+        return table
+
+    def _evict(self):
+        """
+        Drop least recently used entries until the cache is within its
+        limits.  The newest entry is always kept.
+        """
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or
+                                          self._bytes > self.max_bytes):
+            _, (_, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+
+    def clear(self):
+        """
+        Remove every entry and reset the hit and miss counters.
+        """
+        self._entries.clear()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """
+        Returns a dictionary with the hit and miss counts, the number of
+        cached tables and the bytes of source data they hold.
+        """
+        return {"hits": self.hits, "misses": self.misses,
+                "entries": len(self._entries), "bytes": self._bytes}
@@ -0,0 +1,203 @@
+"""
+Parallel parsing of large CSV files.
+
+The file is split into chunks at line breaks and the chunks are parsed
+in a process pool.  A line break inside a quoted field is not a record
+boundary, so chunk starts are only guesses: each chunk is parsed up to
+the first record boundary at or after its end, and the next chunk is
+only used if it started exactly there.  Otherwise it is parsed again
+from the real boundary.  The rows returned are therefore always the
+same as csv.DictReader produces for the whole file.
+
+Every row dictionary is pickled back from its worker, which costs about
+as much as parsing the row, so only large files on machines with several
+CPUs are split; anything else is read serially.
+"""
+
+import csv
+import locale
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+# Files smaller than this are parsed in a single chunk
+MIN_CHUNK_SIZE = 1 << 20
+
+# Files smaller than this are read serially, as are all files on a
+# single CPU machine
+MIN_PARALLEL_SIZE = 32 << 20
+
+# Line breaks tried when looking for a chunk start outside quotes
+_MAX_BOUNDARY_TRIES = 64
+
+# Text mode also ends lines at a carriage return not followed by a
+# newline, which splitting on newlines would miss
+_LONE_CR = re.compile(rb'\r(?!\n)')
+
+
+def _row_dict(fieldnames, row):
+    """
+    Returns the dictionary csv.DictReader builds for row: extra values
+    are kept in a list under the key None and missing fields are None.
+    """
+    result = dict(zip(fieldnames, row))
+    numfields = len(fieldnames)
+    if numfields < len(row):
+        result[None] = row[numfields:]
+    elif numfields > len(row):
+        for key in fieldnames[len(row):]:
+            result[key] = None
+    return result
+
+
+def _parse_records(csvfile, start, end, separator, quote, encoding):
+    """
+    Inputs:
+      csvfile   - CSV file opened in binary mode
+      start     - byte offset of a record boundary to start from
+      end       - byte offset to stop at
+      separator - character that separates fields
+      quote     - character used to optionally quote fields
+      encoding  - text encoding of the file
+    Output:
+      Returns a tuple of the list of records (lists of strings) that
+      start before end, skipping blank lines as csv.DictReader does,
+      and the byte offset just past the last of them.
+    """
+    csvfile.seek(start)
+    position = [start]
+
+    def lines():
+        for line in iter(csvfile.readline, b''):
+            position[0] += len(line)
+            yield line.decode(encoding)
+
+    csvreader = csv.reader(lines(), delimiter=separator, quotechar=quote)
+    records = []
+    while position[0] < end:
+        record = next(csvreader, None)
+        if record is None:
+            break
+        if record:
+            records.append(record)
+    return records, position[0]
+
+
+def _parse_chunk(filename, fieldnames, separator, quote, encoding, start, end):
+    """
+    Parse the records starting in [start, end) into row dictionaries.
+    Runs in a worker process.
+    """
+    with open(filename, 'rb') as csvfile:
+        records, stop = _parse_records(csvfile, start, end, separator, quote, encoding)
+    return [_row_dict(fieldnames, record) for record in records], stop
+
+
+def _serial_read_rows(filename, separator, quote):
+    """
+    Returns the rows of the CSV file read with csv.DictReader.
+    """
+    with open(filename, newline='') as csvfile:
+        return list(csv.DictReader(csvfile, delimiter=separator, quotechar=quote))
+
+
+def _chunk_bounds(data, start, numchunks, chunk_size, quote):
+    """
+    Inputs:
+      data       - mapped contents of the file
+      start      - byte offset where the first chunk starts
+      numchunks  - number of chunks wanted
+      chunk_size - smallest chunk size in bytes
+      quote      - character used to optionally quote fields
+    Output:
+      Returns a list of (start, end) byte ranges covering data from
+      start.  Each later chunk starts just after a line break, preferring
+      one preceded by an even number of quote characters.
+    """
+    size = len(data)
+    step = max(chunk_size, (size - start) // max(numchunks, 1) + 1)
+    quote_byte = quote.encode('ascii') if quote else b''
+    bounds = []
+    chunk_start = start
+    quotes_before = 0
+    while chunk_start < size:
+        guess = chunk_start + step
+        if guess >= size:
+            bounds.append((chunk_start, size))
+            break
+        boundary = data.find(b'\n', guess)
+        if boundary < 0:
+            bounds.append((chunk_start, size))
+            break
+        boundary += 1
+        if quote_byte:
+            quotes = quotes_before + data[chunk_start:boundary].count(quote_byte)
+            for _ in range(_MAX_BOUNDARY_TRIES):
+                if quotes % 2 == 0:
+                    break
+                following = data.find(b'\n', boundary)
+                if following < 0:
+                    break
+                quotes += data[boundary:following + 1].count(quote_byte)
+                boundary = following + 1
+            quotes_before = quotes
+        if boundary >= size:
+            bounds.append((chunk_start, size))
+            break
+        bounds.append((chunk_start, boundary))
+        chunk_start = boundary
+    return bounds
+
+
+def parallel_read_rows(filename, separator, quote, workers=None,
+                       chunk_size=MIN_CHUNK_SIZE):
+    """
+    Inputs:
+      filename   - name of CSV file
+      separator  - character that separates fields
+      quote      - character used to optionally quote fields
+      workers    - number of worker processes (None uses one per CPU)
+      chunk_size - smallest chunk handed to a worker, in bytes
+    Output:
+      Returns a list of dictionaries, one per row, identical to the
+      rows csv.DictReader reads from the file.  The file is read
+      serially if it is smaller than MIN_PARALLEL_SIZE, if workers is 1
+      or if the machine has a single CPU.
+    """
+    encoding = locale.getpreferredencoding(False)
+    size = os.path.getsize(filename)
+    if size == 0:
+        return []
+    if size < MIN_PARALLEL_SIZE or workers == 1 or (os.cpu_count() or 1) == 1:
+        return _serial_read_rows(filename, separator, quote)
+    with open(filename, 'rb') as csvfile:
+        header, header_end = _parse_records(csvfile, 0, 1, separator, quote, encoding)
+        # DictReader takes the first line as the header even if it is blank
+        fieldnames = header[0] if header else []
+        with mmap.mmap(csvfile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if _LONE_CR.search(data):
+                return _serial_read_rows(filename, separator, quote)
+            numchunks = (workers or os.cpu_count() or 1) * 4
+            bounds = _chunk_bounds(data, header_end, numchunks, chunk_size, quote)
+
+    if len(bounds) <= 1:
+        results = [_parse_chunk(filename, fieldnames, separator, quote, encoding, start, end)
+                   for start, end in bounds]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_parse_chunk, filename, fieldnames, separator,
+                                       quote, encoding, start, end)
+                       for start, end in bounds]
+            results = [future.result() for future in futures]
+
+    rows = []
+    expected = header_end
+    for (start, end), (chunk_rows, stop) in zip(bounds, results):
+        if start != expected:
+            # The guessed start was inside a record; parse from the real one
+            chunk_rows, stop = _parse_chunk(filename, fieldnames, separator, quote,
+                                            encoding, expected, end)
+        rows.extend(chunk_rows)
+        expected = stop
+    return rows
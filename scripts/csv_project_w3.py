@@ -4,63 +4,213 @@ Project for Week 3 of "Python Data Analysis".
 Read and write CSV files using a dictionary of dictionaries.
 
 """
+import array
 import csv
+import heapq
+import os
+from collections.abc import Mapping
+from csv_parallel import parallel_read_rows
+from column_table import (ColumnTable, column_table_from_rows, read_csv_as_column_table,
+                          _interned_column, _typed_column)
 
-def read_csv_fieldnames(filename, separator, quote):
+# Characters of a file read to detect its dialect
+SNIFF_SIZE = 8192
+
+# Separators considered when detecting a dialect
+SNIFF_SEPARATORS = ',;\t |:'
+
+# Dialect used when a file's dialect cannot be detected
+DEFAULT_DIALECT = (',', '"', False)
+
+# Detected dialects, keyed on the file's path, modification time and size
+_DIALECT_CACHE = {}
+
+
+def sniff_dialect(filename):
+    """
+    Inputs:
+      filename - name of CSV file
+    Output:
+      Returns a tuple of the separator, the quote character and whether
+      spaces after a separator are skipped, detected with csv.Sniffer
+      from the first SNIFF_SIZE characters of the file.  Returns
+      DEFAULT_DIALECT if the dialect cannot be detected.  Results are
+      cached until the file changes.
+    """
+    stat = os.stat(filename)
+    key = (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+    if key in _DIALECT_CACHE:
+        return _DIALECT_CACHE[key]
+
+    with open(filename, newline='') as csvfile:
+        sample = csvfile.read(SNIFF_SIZE)
+    if len(sample) == SNIFF_SIZE:
+        # Only sniff complete lines
+        last_line = sample.rfind('\n')
+        if last_line > 0:
+            sample = sample[:last_line]
+    try:
+        sniffed = csv.Sniffer().sniff(sample, delimiters=SNIFF_SEPARATORS)
+        # Space separated columns are often aligned with runs of spaces
+        dialect = (sniffed.delimiter, sniffed.quotechar or '"',
+                   bool(sniffed.skipinitialspace) or sniffed.delimiter == ' ')
+    except csv.Error:
+        dialect = DEFAULT_DIALECT
+    _DIALECT_CACHE[key] = dialect
+    return dialect
+
+
+def _resolve_dialect(filename, separator, quote):
+    """
+    Returns the (separator, quote, skipinitialspace) tuple to read
+    filename with, detecting whichever of separator and quote is None
+    (see sniff_dialect).  Spaces after separators are only skipped when
+    the dialect was detected.
+    """
+    if separator is not None and quote is not None:
+        return separator, quote, False
+    sniffed = sniff_dialect(filename)
+    return (sniffed[0] if separator is None else separator,
+            sniffed[1] if quote is None else quote, sniffed[2])
+
+
+def read_csv_fieldnames(filename, separator=None, quote=None):
     """
     Inputs:
       filename  - name of CSV file
-      separator - character that separates fields
-      quote     - character used to optionally quote fields
+      separator - character that separates fields (None to detect it)
+      quote     - character used to optionally quote fields (None to
+                  detect it)
     Output:
       A list of strings corresponding to the field names in 
       the given CSV file.
     """
+    separator, quote, skipspace = _resolve_dialect(filename, separator, quote)
     fieldnamess=[]
     with open(filename, newline='') as csvfile:
-        csv_reader=csv.DictReader(csvfile,delimiter=separator,quotechar=quote)
+        csv_reader=csv.DictReader(csvfile,delimiter=separator,quotechar=quote,
+                                  skipinitialspace=skipspace)
         fieldnamess=csv_reader.fieldnames
     return fieldnamess
 
-def read_csv_as_list_dict(filename, separator, quote):
+def read_csv_as_list_dict(filename, separator=None, quote=None, columnar=False,
+                          workers=None):
     """
     Inputs:
       filename  - name of CSV file
-      separator - character that separates fields
-      quote     - character used to optionally quote fields
+      separator - character that separates fields (None to detect it)
+      quote     - character used to optionally quote fields (None to
+                  detect it)
+      columnar  - if True, return a ColumnTable instead
+      workers   - if given, parse the file in chunks with this many
+                  worker processes (see csv_parallel)
     Output:
       Returns a list of dictionaries where each item in the list
       corresponds to a row in the CSV file.  The dictionaries in the
       list map the field names to the field values for that row.
+      A ColumnTable is mapped from a current snapshot of the file
+      (see csv_snapshot) when one exists.
+    """
+    separator, quote, skipspace = _resolve_dialect(filename, separator, quote)
+    if skipspace:
+        # Snapshots and chunked parsing do not skip spaces after separators
+        if columnar:
+            return _read_spaced_column_table(filename, separator, quote)
+        return list(iter_csv_as_list_dict(filename, separator, quote, True))
+    if columnar:
+        return read_csv_as_column_table(filename, separator, quote)
+    if workers is not None:
+        return parallel_read_rows(filename, separator, quote, workers)
+    return list(iter_csv_as_list_dict(filename, separator, quote))
+
+
+def _read_spaced_column_table(filename, separator, quote, keyfield=None):
+    """
+    Returns a ColumnTable of a CSV file whose separators are followed
+    by spaces, which are skipped.
     """
     with open(filename, newline='') as csvfile:
-        csv_list_dict=[]
-        csv_reader=csv.DictReader(csvfile, delimiter=separator, quotechar=quote)
-        for dct in map(dict, csv_reader):
-            csv_list_dict.append(dct)
-    
-    return csv_list_dict
+        csv_reader=csv.reader(csvfile, delimiter=separator, quotechar=quote,
+                              skipinitialspace=True)
+        fieldnames = next(csv_reader, [])
+        return column_table_from_rows(fieldnames, csv_reader, keyfield)
+
+
+def iter_csv_as_list_dict(filename, separator=None, quote=None,
+                          skipinitialspace=None):
+    """
+    Inputs:
+      filename         - name of CSV file
+      separator        - character that separates fields (None to detect it)
+      quote            - character used to optionally quote fields (None to
+                         detect it)
+      skipinitialspace - whether to skip spaces after separators (None to
+                         skip them only if detected)
+    Output:
+      Generator yielding one dictionary per row of the CSV file, as in
+      read_csv_as_list_dict, while reading the file one row at a time.
+    """
+    separator, quote, skipspace = _resolve_dialect(filename, separator, quote)
+    if skipinitialspace is not None:
+        skipspace = skipinitialspace
+    with open(filename, newline='') as csvfile:
+        csv_reader=csv.DictReader(csvfile, delimiter=separator, quotechar=quote,
+                                  skipinitialspace=skipspace)
+        yield from csv_reader
 
 
-def read_csv_as_nested_dict(filename, keyfield, separator, quote):
+def read_csv_as_nested_dict(filename, keyfield, separator=None, quote=None,
+                            columnar=False, workers=None):
     """
     Inputs:
       filename  - name of CSV file
       keyfield  - field to use as key for rows
-      separator - character that separates fields
-      quote     - character used to optionally quote fields
+      separator - character that separates fields (None to detect it)
+      quote     - character used to optionally quote fields (None to
+                  detect it)
+      columnar  - if True, return a ColumnTable keyed on keyfield instead
+      workers   - if given, parse the file in chunks with this many
+                  worker processes (see csv_parallel)
     Output:
       Returns a dictionary of dictionaries where the outer dictionary
       maps the value in the key_field to the corresponding row in the
       CSV file.  The inner dictionaries map the field names to the
-      field values for that row.
+      field values for that row.  A ColumnTable is mapped from a
+      current snapshot of the file (see csv_snapshot) when one exists.
     """
-    with open(filename, newline='') as csvfile:
-        csv_nestdict={}
-        csv_reader=csv.DictReader(csvfile, delimiter=separator , quotechar=quote)
-        for row in map(dict, csv_reader):
-            csv_nestdict[row[keyfield]]=row
-    return csv_nestdict
+    separator, quote, skipspace = _resolve_dialect(filename, separator, quote)
+    if skipspace:
+        # Snapshots and chunked parsing do not skip spaces after separators
+        if columnar:
+            return _read_spaced_column_table(filename, separator, quote, keyfield)
+        return dict(iter_csv_as_nested_dict(filename, keyfield, separator, quote,
+                                            True))
+    if columnar:
+        return read_csv_as_column_table(filename, separator, quote, keyfield)
+    if workers is not None:
+        return {row[keyfield]: row for row in
+                parallel_read_rows(filename, separator, quote, workers)}
+    return dict(iter_csv_as_nested_dict(filename, keyfield, separator, quote))
+
+
+def iter_csv_as_nested_dict(filename, keyfield, separator=None, quote=None,
+                            skipinitialspace=None):
+    """
+    Inputs:
+      filename         - name of CSV file
+      keyfield         - field to use as key for rows
+      separator        - character that separates fields (None to detect it)
+      quote            - character used to optionally quote fields (None to
+                         detect it)
+      skipinitialspace - whether to skip spaces after separators (None to
+                         skip them only if detected)
+    Output:
+      Generator yielding (key, row dictionary) pairs for each row of the
+      CSV file, as in read_csv_as_nested_dict, while reading the file
+      one row at a time.
+    """
+    for row in iter_csv_as_list_dict(filename, separator, quote, skipinitialspace):
+        yield row[keyfield], row
 
 
 def write_csv_from_list_dict(filename, table, fieldnames, separator, quote):
@@ -84,6 +234,239 @@ def write_csv_from_list_dict(filename, table, fieldnames, separator, quote):
         csv_writer.writeheader()
         csv_writer.writerows(table)
 
+
+
+# FIPS county codes are five digits, zero-padded
+FIPS_WIDTH = 5
+
+
+def normalize_fips(value):
+    """
+    Inputs:
+      value - FIPS code as a string ('01001', '1001') or a number
+    Output:
+      Returns the code as a zero-padded string of FIPS_WIDTH digits, or
+      None if value is not a code (such as '-' for nationwide rows).
+    """
+    if isinstance(value, int):
+        return str(value).zfill(FIPS_WIDTH)
+    if isinstance(value, float):
+        return str(int(value)).zfill(FIPS_WIDTH) if value.is_integer() else None
+    if value is None:
+        return None
+    value = value.strip()
+    if not value.isdigit():
+        return None
+    return value.zfill(FIPS_WIDTH)
+
+
+def _join_rows(table):
+    """
+    Returns a tuple of an iterable over the rows of table (a list or
+    dictionary of rows, a ColumnTable or any iterable of rows), its
+    number of rows, or None if it cannot be known without reading it,
+    and its field names if the table declares them (as a ColumnTable
+    or a csv.DictReader does).
+    """
+    names = getattr(table, 'fieldnames', None)
+    if isinstance(table, ColumnTable):
+        return table.rows(), len(table), names
+    if isinstance(table, Mapping):
+        return table.values(), len(table), None
+    try:
+        return table, len(table), names
+    except TypeError:
+        return table, None, names
+
+
+def _join_fields(fields, rows, names, key):
+    """
+    Returns a tuple of the output names and the fields to take from
+    each row, for fields given as a list of field names or indices or as
+    a dictionary mapping output names to them, and rows.  When fields is
+    None, every field in names (or else in the first row) other than key
+    is used; rows must then be dictionaries, and the first row is put
+    back into the rows returned if it had to be read.  Raises ValueError
+    if fields is None for a table with no rows and no declared names,
+    since its fields cannot be known.
+    """
+    if isinstance(fields, Mapping):
+        return list(fields), list(fields.values()), rows
+    if fields is not None:
+        return [str(field) for field in fields], list(fields), rows
+    if names is None:
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            raise ValueError("fields must be given for an empty table "
+                             "that does not declare its field names")
+        if not isinstance(first, Mapping):
+            raise ValueError("fields must be given for rows that are not dictionaries")
+        names = list(first)
+        rows = _prepend(first, rows)
+    names = [name for name in names if name != key]
+    return names, names, rows
+
+
+def _prepend(first, rows):
+    """
+    Generator yielding first and then every item of rows.
+    """
+    yield first
+    yield from rows
+
+
+def _join_column(values):
+    """
+    Returns the most compact column holding the joined values: text is
+    typed as by the CSV readers (see column_table._typed_column), so
+    zero-padded codes stay strings, and numbers taken from a typed
+    ColumnTable go back into an array of the same kind.  Any other mix
+    of values is kept as a list.
+    """
+    if all(isinstance(val, str) or val is None for val in values):
+        return _typed_column(values)
+    if all(type(val) is int for val in values):
+        try:
+            return array.array('q', values)
+        except OverflowError:
+            return values
+    if all(type(val) is float for val in values):
+        return array.array('d', values)
+    return values
+
+
+def join_by_fips(left, right, left_key, right_key, left_fields=None,
+                 right_fields=None, keyname='FIPS'):
+    """
+    Inputs:
+      left, right  - tables to join: a list or nested dictionary of rows
+                     (as read by read_csv_as_list_dict or
+                     read_csv_as_nested_dict), a ColumnTable, or any
+                     iterable of rows such as iter_csv_as_list_dict or a
+                     csv.reader over a file without a header
+      left_key     - field name (or index, for rows that are lists)
+                     holding the FIPS code in left rows
+      right_key    - field name or index holding the FIPS code in right
+                     rows
+      left_fields  - fields of left rows to keep: a list of field names
+                     or indices, or a dictionary mapping output field
+                     names to them.  Defaults to every field but the key
+                     when rows are dictionaries.
+      right_fields - fields of right rows to keep, as for left_fields
+      keyname      - name of the FIPS code field in the result
+    Output:
+      Returns a ColumnTable keyed on keyname with one row per pair of
+      left and right rows whose FIPS codes match once zero-padded (see
+      normalize_fips), holding the key followed by the left and right
+      fields.  Each field is stored as a typed column when its values
+      allow it (see _join_column): numeric text becomes int or float
+      columns ready for plotting, while zero-padded codes and other
+      text stay strings.  The result has every declared field even
+      when no rows match.  The hash
+      table is built on the smaller table and the other is read one row
+      at a time, so its rows are never all held in memory; the result
+      follows the order of the streamed table.  Iterables whose length
+      is not known are always streamed.
+    """
+    left_rows, left_size, left_names = _join_rows(left)
+    right_rows, right_size, right_names = _join_rows(right)
+    left_names, left_fields, left_rows = _join_fields(left_fields, left_rows,
+                                                      left_names, left_key)
+    right_names, right_fields, right_rows = _join_fields(right_fields, right_rows,
+                                                         right_names, right_key)
+    fieldnames = [keyname] + left_names + right_names
+    if len(set(fieldnames)) != len(fieldnames):
+        raise ValueError("joined field names are not unique: %s" % fieldnames)
+
+    build_left = right_size is None or (left_size is not None and left_size <= right_size)
+    if build_left:
+        build_rows, build_key, build_fields = left_rows, left_key, left_fields
+        probe_rows, probe_key, probe_fields = right_rows, right_key, right_fields
+    else:
+        build_rows, build_key, build_fields = right_rows, right_key, right_fields
+        probe_rows, probe_key, probe_fields = left_rows, left_key, left_fields
+
+    table = {}
+    for row in build_rows:
+        key = normalize_fips(row[build_key])
+        if key is not None:
+            table.setdefault(key, []).append([row[field] for field in build_fields])
+
+    def joined():
+        for row in probe_rows:
+            key = normalize_fips(row[probe_key])
+            matches = table.get(key)
+            if not matches:
+                continue
+            values = [row[field] for field in probe_fields]
+            for match in matches:
+                if build_left:
+                    yield [key] + match + values
+                else:
+                    yield [key] + values + match
+
+    values = [[] for _ in fieldnames]
+    for row in joined():
+        for column, value in zip(values, row):
+            column.append(value)
+    columns = {keyname: _interned_column(values[0])}
+    for field, column in zip(fieldnames[1:], values[1:]):
+        columns[field] = _join_column(column)
+    return ColumnTable(fieldnames, columns, keyname)
+
+
+
+def trim_csv(in_filename, out_filename, sortfield, numrows, separator, quote,
+             fieldnames=None, out_fieldnames=None, largest=True):
+    """
+    Inputs:
+      in_filename    - name of CSV file to trim
+      out_filename   - name of CSV file to write
+      sortfield      - numeric field to rank rows by
+      numrows        - number of rows to keep
+      separator      - character that separates fields
+      quote          - character used to optionally quote fields
+      fieldnames     - field names for a file without a header line,
+                       or None to read them from the first line
+      out_fieldnames - fields to write, in order (defaults to all)
+      largest        - if True keep the rows with the largest values,
+                       otherwise the smallest
+    Output:
+      Writes the numrows rows with the largest (or smallest) values in
+      sortfield to out_filename with write_csv_from_list_dict, sorted
+      by that value, ties in file order.  Rows whose value is not a
+      number (such as '-') are skipped.  The file is read one row at a
+      time and only the rows kept are held in memory; only sortfield is
+      converted to a number.
+    """
+    heap = []
+    with open(in_filename, newline='') as csvfile:
+        csv_reader = csv.DictReader(csvfile, fieldnames=fieldnames,
+                                    delimiter=separator, quotechar=quote)
+        if out_fieldnames is None:
+            out_fieldnames = csv_reader.fieldnames or []
+        sign = 1 if largest else -1
+        for position, row in enumerate(csv_reader):
+            try:
+                value = sign * float(row[sortfield])
+            except (TypeError, ValueError):
+                continue
+            # Smallest entry on top; among equal values the latest row goes first
+            entry = (value, -position)
+            if len(heap) < numrows:
+                heapq.heappush(heap, (entry, {field: row[field] for field in out_fieldnames}))
+            elif heap and entry > heap[0][0]:
+                heapq.heapreplace(heap, (entry, {field: row[field] for field in out_fieldnames}))
+    heap.sort(reverse=True)
+    write_csv_from_list_dict(out_filename, [row for _, row in heap], out_fieldnames,
+                             separator, quote)
+
+# The county risk file has no header; the total risk is its twelfth field
+#riskfields=['state', 'county', 'fips', 'region', 'population'] + [str(idx) for idx in range(5, 11)] + ['risk'] + [str(idx) for idx in range(12, 93)]
+#trim_csv('cancer_risk05_v4_county.csv', 'cancer_risk_trimmed.csv', 'risk', 3276, ',', '"',
+#         riskfields, ['state', 'county', 'fips', 'population', 'risk'])
+
     
 #tablee=read_csv_as_list_dict('table1.csv',',','"' )
 #fieldnamess=read_csv_fieldnames('table1.csv',',','"' )
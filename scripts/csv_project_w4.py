@@ -4,51 +4,96 @@ Processing CSV files with baseball stastics.
 
 """
 
+import array
 import csv
+import heapq
+from collections import OrderedDict
+import numpy
+from csv_parallel import parallel_read_rows
+from column_table import ColumnTable, read_csv_as_column_table
 
 ##
 ## Provided code from Week 3 Project
 ##
 
-def read_csv_as_list_dict(filename, separator, quote):
+def read_csv_as_list_dict(filename, separator, quote, columnar=False, workers=None):
     """
     Inputs:
       filename  - name of CSV file
       separator - character that separates fields
       quote     - character used to optionally quote fields
+      columnar  - if True, return a ColumnTable instead
+      workers   - if given, parse the file in chunks with this many
+                  worker processes (see csv_parallel)
     Output:
       Returns a list of dictionaries where each item in the list
       corresponds to a row in the CSV file.  The dictionaries in the
       list map the field names to the field values for that row.
+      A ColumnTable is mapped from a current snapshot of the file
+      (see csv_snapshot) when one exists.
+    """
+    if columnar:
+        return read_csv_as_column_table(filename, separator, quote)
+    if workers is not None:
+        return parallel_read_rows(filename, separator, quote, workers)
+    return list(iter_csv_as_list_dict(filename, separator, quote))
+
+
+def iter_csv_as_list_dict(filename, separator, quote):
+    """
+    Inputs:
+      filename  - name of CSV file
+      separator - character that separates fields
+      quote     - character used to optionally quote fields
+    Output:
+      Generator yielding one dictionary per row of the CSV file, as in
+      read_csv_as_list_dict, while reading the file one row at a time.
     """
-    table = []
     with open(filename, newline='') as csvfile:
         csvreader = csv.DictReader(csvfile, delimiter=separator, quotechar=quote)
-        for row in csvreader:
-            table.append(row)
-    return table
+        yield from csvreader
 
 
-def read_csv_as_nested_dict(filename, keyfield, separator, quote):
+def read_csv_as_nested_dict(filename, keyfield, separator, quote, columnar=False,
+                            workers=None):
     """
     Inputs:
       filename  - name of CSV file
       keyfield  - field to use as key for rows
       separator - character that separates fields
       quote     - character used to optionally quote fields
+      columnar  - if True, return a ColumnTable keyed on keyfield instead
+      workers   - if given, parse the file in chunks with this many
+                  worker processes (see csv_parallel)
     Output:
       Returns a dictionary of dictionaries where the outer dictionary
       maps the value in the key_field to the corresponding row in the
       CSV file.  The inner dictionaries map the field names to the
-      field values for that row.
+      field values for that row.  A ColumnTable is mapped from a
+      current snapshot of the file (see csv_snapshot) when one exists.
     """
-    table = {}
-    with open(filename, newline='') as csvfile:
-        csvreader = csv.DictReader(csvfile, delimiter=separator, quotechar=quote)
-        for row in csvreader:
-            rowid = row[keyfield]
-            table[rowid] = row
-    return table
+    if columnar:
+        return read_csv_as_column_table(filename, separator, quote, keyfield)
+    if workers is not None:
+        return {row[keyfield]: row for row in
+                parallel_read_rows(filename, separator, quote, workers)}
+    return dict(iter_csv_as_nested_dict(filename, keyfield, separator, quote))
+
+
+def iter_csv_as_nested_dict(filename, keyfield, separator, quote):
+    """
+    Inputs:
+      filename  - name of CSV file
+      keyfield  - field to use as key for rows
+      separator - character that separates fields
+      quote     - character used to optionally quote fields
+    Output:
+      Generator yielding (key, row dictionary) pairs for each row of the
+      CSV file, as in read_csv_as_nested_dict, while reading the file
+      one row at a time.
+    """
+    for row in iter_csv_as_list_dict(filename, separator, quote):
+        yield row[keyfield], row
 
 ##
 ## Provided formulas for common batting statistics
@@ -57,6 +102,34 @@ def read_csv_as_nested_dict(filename, keyfield, separator, quote):
 # Typical cutoff used for official statistics
 MINIMUM_AB = 500
 
+class BattingColumns(dict):
+    """
+    Dictionary mapping batting field names to float arrays holding the
+    field for every row.  The provided formulas below accept a
+    BattingColumns in place of a single row and return an array with
+    one statistic per row; they are marked with column_formula.
+    """
+
+
+def column_formula(formula):
+    """
+    Marks formula as also accepting a BattingColumns in place of a
+    single row, so evaluate_formula calls it once on whole columns.
+    Returns formula.
+    """
+    formula.accepts_columns = True
+    return formula
+
+
+def _qualified_ratio(numerator, denominator, at_bats):
+    """
+    Returns numerator / denominator for rows with at least MINIMUM_AB
+    at bats and 0 for every other row.
+    """
+    return numpy.divide(numerator, denominator, out=numpy.zeros(len(at_bats)),
+                        where=at_bats >= MINIMUM_AB)
+
+@column_formula
 def batting_average(info, batting_stats):
     """
     Inputs:
@@ -64,6 +137,9 @@ def batting_average(info, batting_stats):
     Output:
       Returns the batting average as a float
     """
+    if isinstance(batting_stats, BattingColumns):
+        at_bats = batting_stats[info["atbats"]]
+        return _qualified_ratio(batting_stats[info["hits"]], at_bats, at_bats)
     hits = float(batting_stats[info["hits"]])
     at_bats = float(batting_stats[info["atbats"]])
     if at_bats >= MINIMUM_AB:
@@ -71,6 +147,7 @@ def batting_average(info, batting_stats):
     else:
         return 0
 
+@column_formula
 def onbase_percentage(info, batting_stats):
     """
     Inputs:
@@ -78,6 +155,10 @@ def onbase_percentage(info, batting_stats):
     Output:
       Returns the on-base percentage as a float
     """
+    if isinstance(batting_stats, BattingColumns):
+        at_bats = batting_stats[info["atbats"]]
+        walks = batting_stats[info["walks"]]
+        return _qualified_ratio(batting_stats[info["hits"]] + walks, at_bats + walks, at_bats)
     hits = float(batting_stats[info["hits"]])
     at_bats = float(batting_stats[info["atbats"]])
     walks = float(batting_stats[info["walks"]])
@@ -86,6 +167,7 @@ def onbase_percentage(info, batting_stats):
     else:
         return 0
 
+@column_formula
 def slugging_percentage(info, batting_stats):
     """
     Inputs:
@@ -93,6 +175,14 @@ def slugging_percentage(info, batting_stats):
     Output:
       Returns the slugging percentage as a float
     """
+    if isinstance(batting_stats, BattingColumns):
+        doubles = batting_stats[info["doubles"]]
+        triples = batting_stats[info["triples"]]
+        home_runs = batting_stats[info["homeruns"]]
+        singles = batting_stats[info["hits"]] - doubles - triples - home_runs
+        at_bats = batting_stats[info["atbats"]]
+        return _qualified_ratio(singles + 2 * doubles + 3 * triples + 4 * home_runs,
+                                at_bats, at_bats)
     hits = float(batting_stats[info["hits"]])
     doubles = float(batting_stats[info["doubles"]])
     triples = float(batting_stats[info["triples"]])
@@ -105,6 +195,78 @@ def slugging_percentage(info, batting_stats):
         return 0
 
 
+# Keys of the info dictionary naming the fields held by BattingColumns
+BATTING_COLUMN_KEYS = ("atbats", "hits", "doubles", "triples", "homeruns", "walks")
+
+def batting_columns(info, statistics):
+    """
+    Inputs:
+      info       - Baseball data information dictionary
+      statistics - List of batting statistics dictionaries, or a
+                   ColumnTable
+    Output:
+      Returns a BattingColumns holding a float array for each batting
+      field named in info.
+    """
+    fields = [info[key] for key in BATTING_COLUMN_KEYS if key in info]
+    if isinstance(statistics, ColumnTable):
+        return BattingColumns((field, numpy.asarray(statistics.column(field), dtype=float))
+                              for field in fields)
+    return BattingColumns((field, numpy.fromiter((float(row[field]) for row in statistics),
+                                                 dtype=float, count=len(statistics)))
+                          for field in fields)
+
+
+def evaluate_formula(info, columns, formula, statistics):
+    """
+    Inputs:
+      info       - Baseball data information dictionary
+      columns    - BattingColumns for statistics, or None to build them
+                   from statistics if they are needed
+      formula    - function that takes an info dictionary and a
+                   batting statistics dictionary as input and
+                   computes a compound statistic
+      statistics - Sequence of the batting statistics rows in columns
+    Output:
+      Returns a float array with formula computed for every row.  A
+      formula marked with column_formula is called once on the whole
+      columns; any other formula is called row by row, on the rows of
+      statistics.
+    """
+    numrows = len(statistics)
+    if getattr(formula, 'accepts_columns', False):
+        if columns is None:
+            columns = batting_columns(info, statistics)
+        values = numpy.asarray(formula(info, columns), dtype=float)
+        return numpy.broadcast_to(values, (numrows,))
+    return numpy.fromiter((formula(info, row) for row in statistics),
+                          dtype=float, count=numrows)
+
+
+def _is_numeric_column(column):
+    """
+    Returns True if a ColumnTable column stores numbers (an array, or a
+    memoryview of a snapshot) rather than text.
+    """
+    return isinstance(column, (array.array, memoryview))
+
+
+def _select_top(player_ids, values, numplayers):
+    """
+    Returns (player ID, value) tuples for the numplayers largest values,
+    in decreasing order with ties kept in input order (as a stable sort
+    would).
+    """
+    negated = -values
+    if 0 < numplayers < len(values):
+        cutoff = numpy.partition(negated, numplayers - 1)[numplayers - 1]
+        candidates = numpy.flatnonzero(negated <= cutoff)
+    else:
+        candidates = numpy.arange(len(values))
+    order = candidates[numpy.argsort(negated[candidates], kind='stable')][:max(numplayers, 0)]
+    return [(player_ids[idx], float(values[idx])) for idx in order]
+
+
 ##
 ## Part 1: Functions to compute top batting statistics by year
 ##
@@ -112,20 +274,39 @@ def slugging_percentage(info, batting_stats):
 def filter_by_year(statistics, year, yearid):
     """
     Inputs:
-      statistics - List of batting statistics dictionaries
+      statistics - List of batting statistics dictionaries (or any
+                   iterable of them, e.g. from iter_csv_as_list_dict)
       year       - Year to filter by
       yearid     - Year ID field in statistics
     Outputs:
       Returns a list of batting statistics dictionaries that
-      are from the input year.
+      are from the input year.  If statistics is a ColumnTable, a
+      ColumnTable of the matching rows is returned instead.
     """
+    if isinstance(statistics, ColumnTable):
+        years = statistics.column(yearid)
+        if _is_numeric_column(years):
+            year = int(year)
+        else:
+            year = str(year)
+        return statistics.take(idx for idx, yr in enumerate(years) if yr == year)
+
     filtered=[]
     filtered=[x for x in statistics if x[yearid] == str(year)]
     
     return filtered
 
 
-def top_player_ids(info, statistics, formula, numplayers):
+def _ranking_key(player_and_stat):
+    """
+    Sort key ordering (player ID, statistic) tuples by decreasing
+    statistic, then by increasing player ID.
+    """
+    return (-player_and_stat[1], player_and_stat[0])
+
+
+def top_player_ids(info, statistics, formula, numplayers, partial=False,
+                   vectorized=False):
     """
     Inputs:
       info       - Baseball data information dictionary
@@ -134,11 +315,32 @@ def top_player_ids(info, statistics, formula, numplayers):
                    batting statistics dictionary as input and
                    computes a compound statistic
       numplayers - Number of top players to return
+      partial    - if True, select the top players with a bounded heap
+                   instead of sorting every player.  statistics may then
+                   be any iterable (e.g. a generator), which is consumed
+                   one row at a time, and ties are broken by player ID.
+      vectorized - if True, compute a formula marked with
+                   column_formula over whole columns of statistics
+                   with numpy (see evaluate_formula)
     Outputs:
       Returns a list of tuples, player ID and compound statistic
       computed by formula, of the top numplayers players sorted in
       decreasing order of the computed statistic.
     """
+    if vectorized:
+        if isinstance(statistics, ColumnTable):
+            player_ids=statistics.column(info["playerid"])
+        else:
+            statistics=list(statistics)
+            player_ids=[p[info["playerid"]] for p in statistics]
+        values=evaluate_formula(info, None, formula, statistics)
+        return _select_top(player_ids, values, numplayers)
+
+    if partial:
+        playerid=info["playerid"]
+        candidates=((p[playerid], formula(info, p)) for p in statistics)
+        return heapq.nsmallest(numplayers, candidates, key=_ranking_key)
+
     top_players=[]
 #    print(statistics)
     
@@ -175,7 +377,7 @@ def lookup_player_names(info, top_ids_and_stats):
     return lookup
 
 
-def compute_top_stats_year(info, formula, numplayers, year):
+def compute_top_stats_year(info, formula, numplayers, year, columnar=False):
     """
     Inputs:
       info        - Baseball data information dictionary
@@ -184,19 +386,107 @@ def compute_top_stats_year(info, formula, numplayers, year):
                     computes a compound statistic
       numplayers  - Number of top players to return
       year        - Year to filter by
+      columnar    - if True, read the batting file as a ColumnTable and
+                    compute formula over its columns (see
+                    evaluate_formula).  Formulas not marked with
+                    column_formula are then computed row by row on rows
+                    holding numbers instead of strings.
     Outputs:
       Returns a list of strings for the top numplayers in the given year
       according to the given formula.
     """
-    batting=read_csv_as_list_dict(info['battingfile'],',','"')
+    batting=read_csv_as_list_dict(info['battingfile'],',','"', columnar=columnar)
     
     filtered_batting= filter_by_year(batting,year,info['yearid'])
-    top_players=top_player_ids(info,filtered_batting,formula,numplayers)
+    top_players=top_player_ids(info,filtered_batting,formula,numplayers,vectorized=columnar)
     lookup_players=lookup_player_names(info, top_players)
     
     return lookup_players
 
 
+class BattingIndex:
+    """
+    Batting statistics grouped by year, with player names, loaded once
+    so that repeated yearly leaderboard queries do not re-read the
+    batting and master files.
+    """
+
+    def __init__(self, info):
+        """
+        Inputs:
+          info - Baseball data information dictionary
+        """
+        self.info = info
+        self.batting = read_csv_as_list_dict(info['battingfile'], info['separator'],
+                                             info['quote'], columnar=True)
+        self.columns = batting_columns(info, self.batting)
+        self._text_rows = None
+        self.years = {}
+        for idx, year in enumerate(self.batting.column(info['yearid'])):
+            self.years.setdefault(str(year), []).append(idx)
+
+        master = read_csv_as_list_dict(info['masterfile'], info['separator'],
+                                       info['quote'], columnar=True)
+        self.names = {}
+        for player, first, last in zip(master.column(info['playerid']),
+                                       master.column(info['firstname']),
+                                       master.column(info['lastname'])):
+            self.names[str(player)] = str(first) + ' ' + str(last)
+
+    def rows_for_year(self, year):
+        """
+        Inputs:
+          year - Year to filter by
+        Outputs:
+          Returns a list of batting statistics dictionaries (values are
+          strings) from the input year, as filter_by_year returns for
+          the rows of read_csv_as_list_dict.  The dictionaries are read
+          from the batting file the first time they are needed.
+        """
+        if self._text_rows is None:
+            self._text_rows = read_csv_as_list_dict(self.info['battingfile'],
+                                                    self.info['separator'],
+                                                    self.info['quote'])
+        return [self._text_rows[idx] for idx in self.years.get(str(year), [])]
+
+    def lookup_player_names(self, top_ids_and_stats):
+        """
+        Inputs:
+          top_ids_and_stats - list of tuples containing player IDs and
+                              computed statistics
+        Outputs:
+          Same strings as lookup_player_names, using the names loaded
+          with the index.
+        """
+        return [format(stat, '.3f') + ' --- ' + self.names[player]
+                for player, stat in top_ids_and_stats]
+
+    def compute_top_stats_year(self, formula, numplayers, year):
+        """
+        Inputs:
+          formula     - function that takes an info dictionary and a
+                        batting statistics dictionary as input and
+                        computes a compound statistic
+          numplayers  - Number of top players to return
+          year        - Year to filter by
+        Outputs:
+          Same as compute_top_stats_year, but only visits the rows of
+          the given year.  A formula marked with column_formula is
+          evaluated on their columns; any other formula is called on
+          their dictionaries of strings (see rows_for_year).
+        """
+        if not getattr(formula, 'accepts_columns', False):
+            top_players = top_player_ids(self.info, self.rows_for_year(year), formula,
+                                         numplayers)
+            return self.lookup_player_names(top_players)
+        indices = numpy.array(self.years.get(str(year), []), dtype=int)
+        columns = BattingColumns((field, col[indices]) for field, col in self.columns.items())
+        player_ids = self.batting.column(self.info['playerid'])
+        values = evaluate_formula(self.info, columns, formula, indices)
+        top_players = _select_top([player_ids[idx] for idx in indices], values, numplayers)
+        return self.lookup_player_names(top_players)
+
+
 ##
 ## Part 2: Functions to compute top batting statistics by career
 ##
@@ -204,7 +494,8 @@ def compute_top_stats_year(info, formula, numplayers, year):
 def aggregate_by_player_id(statistics, playerid, fields):
     """
     Inputs:
-      statistics - List of batting statistics dictionaries
+      statistics - List of batting statistics dictionaries (or any
+                   iterable of them, e.g. from iter_csv_as_list_dict)
       playerid   - Player ID field name
       fields     - List of fields to aggregate
     Output:
@@ -212,6 +503,9 @@ def aggregate_by_player_id(statistics, playerid, fields):
       are dictionaries of aggregated stats.  Only the fields from the fields
       input will be aggregated in the aggregated stats dictionaries.
     """
+    if isinstance(statistics, ColumnTable):
+        return _aggregate_columns_by_player_id(statistics, playerid, fields)
+
     agg={}
     for row in statistics:
         player=row[playerid]
@@ -242,7 +536,32 @@ def aggregate_by_player_id(statistics, playerid, fields):
     return agg
 
 
-def compute_top_stats_career(info, formula, numplayers):
+def _aggregate_columns_by_player_id(statistics, playerid, fields):
+    """
+    Inputs:
+      statistics - ColumnTable of batting statistics
+      playerid   - Player ID field name
+      fields     - List of fields to aggregate
+    Output:
+      Same as aggregate_by_player_id, but sums each field column by
+      column instead of visiting row dictionaries.
+    """
+    agg={}
+    players=statistics.column(playerid)
+    for player in players:
+        if player not in agg:
+            agg[player]={f:0 for f in fields}
+            agg[player][playerid]=player
+    for field in fields:
+        column=statistics.column(field)
+        if not _is_numeric_column(column):
+            column=[int(val) for val in column]
+        for player, val in zip(players, column):
+            agg[player][field]+=val
+    return agg
+
+
+def compute_top_stats_career(info, formula, numplayers, columnar=False):
     """
     Inputs:
       info        - Baseball data information dictionary
@@ -250,21 +569,157 @@ def compute_top_stats_career(info, formula, numplayers):
                     batting statistics dictionary as input and
                     computes a compound statistic
       numplayers  - Number of top players to return
+      columnar    - if True, read the batting file as a ColumnTable,
+                    sum it column by column and compute formula over
+                    whole columns (see evaluate_formula)
      
     """
     agg={}
     newlist=[]
-    batting=read_csv_as_list_dict(info['battingfile'],info["separator"],info['quote'])
+    batting=read_csv_as_list_dict(info['battingfile'],info["separator"],info['quote'],
+                                  columnar=columnar)
     agg=aggregate_by_player_id(batting,info['playerid'], info['battingfields'])
 #    print(agg.keys())
     for player in agg:
         newlist.append(agg[player])
-    topstats=top_player_ids(info, newlist, formula, numplayers)
+    topstats=top_player_ids(info, newlist, formula, numplayers, vectorized=columnar)
     lookup=lookup_player_names(info, topstats)
     
     return lookup
 
 
+# Formulas whose per-player values a CareerAggregateStore keeps, most
+# recently used last
+CAREER_STATS_CACHE_SIZE = 8
+
+
+class CareerAggregateStore:
+    """
+    Career totals per player that are kept up to date as batting rows
+    are appended or corrected, instead of being rebuilt from the whole
+    batting file for every query.
+
+    Each row is identified by its player ID, year and stint, so
+    applying a row that was already applied replaces it.
+    """
+
+    def __init__(self, info, keyfields=None, stats_cache_size=CAREER_STATS_CACHE_SIZE):
+        """
+        Inputs:
+          info             - Baseball data information dictionary
+          keyfields        - Fields identifying a batting row (defaults
+                             to player ID, year ID and stint)
+          stats_cache_size - Number of formulas whose per-player values
+                             are kept between queries
+        """
+        self.info = info
+        self.playerid = info['playerid']
+        self.fields = info['battingfields']
+        if keyfields is None:
+            keyfields = [info['playerid'], info['yearid'], 'stint']
+        self.keyfields = keyfields
+        self.totals = {}
+        self._rows = {}
+        self._row_counts = {}
+        self._order = {}
+        self._stats = OrderedDict()
+        self.stats_cache_size = stats_cache_size
+
+    def _row_key(self, row):
+        """
+        Returns the tuple identifying a batting row.
+        """
+        return tuple(str(row.get(field, '')) for field in self.keyfields)
+
+    def _add(self, player, counts, sign):
+        """
+        Add (sign 1) or subtract (sign -1) one row's counts from a
+        player's totals and mark the player as changed.
+        """
+        if player not in self.totals:
+            self.totals[player] = {f: 0 for f in self.fields}
+            self.totals[player][self.playerid] = player
+            self._row_counts[player] = 0
+            self._order.setdefault(player, len(self._order))
+        totals = self.totals[player]
+        for field, count in zip(self.fields, counts):
+            totals[field] += sign * count
+        self._row_counts[player] += sign
+        if not self._row_counts[player]:
+            del self.totals[player]
+            del self._row_counts[player]
+        for stats in self._stats.values():
+            stats.pop(player, None)
+
+    def apply_rows(self, statistics):
+        """
+        Inputs:
+          statistics - Iterable of batting statistics dictionaries
+        Action:
+          Adds each row to its player's totals.  A row with the same
+          key as an earlier row replaces that row.
+        """
+        for row in statistics:
+            key = self._row_key(row)
+            if key in self._rows:
+                self._add(*self._rows[key], -1)
+            player = row[self.playerid]
+            counts = tuple(int(row[field]) for field in self.fields)
+            self._rows[key] = (player, counts)
+            self._add(player, counts, 1)
+
+    def remove_rows(self, statistics):
+        """
+        Inputs:
+          statistics - Iterable of batting statistics dictionaries
+        Action:
+          Removes the rows with the same keys from the totals.
+        """
+        for row in statistics:
+            key = self._row_key(row)
+            if key in self._rows:
+                self._add(*self._rows.pop(key), -1)
+
+    def top_player_ids(self, formula, numplayers):
+        """
+        Inputs:
+          formula    - function that takes an info dictionary and a
+                       batting statistics dictionary as input and
+                       computes a compound statistic
+          numplayers - Number of top players to return
+        Outputs:
+          Same as top_player_ids over the career totals.  The formula
+          is only recomputed for players whose totals changed since the
+          last query with this formula, as long as it is one of the
+          stats_cache_size formulas used most recently.  Ranking still
+          visits every player, so each query is O(players).
+        """
+        if formula in self._stats:
+            self._stats.move_to_end(formula)
+        else:
+            self._stats[formula] = {}
+            while len(self._stats) > max(self.stats_cache_size, 1):
+                self._stats.popitem(last=False)
+        stats = self._stats[formula]
+        for player, totals in self.totals.items():
+            if player not in stats:
+                stats[player] = formula(self.info, totals)
+        return heapq.nsmallest(numplayers, stats.items(),
+                               key=lambda item: (-item[1], self._order[item[0]]))
+
+    def compute_top_stats_career(self, formula, numplayers):
+        """
+        Inputs:
+          formula     - function that takes an info dictionary and a
+                        batting statistics dictionary as input and
+                        computes a compound statistic
+          numplayers  - Number of top players to return
+        Outputs:
+          Same as compute_top_stats_career, using the stored totals.
+        """
+        return lookup_player_names(self.info, self.top_player_ids(formula, numplayers))
+
+
 ##
 ## Provided testing code
 ##
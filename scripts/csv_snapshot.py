@@ -0,0 +1,265 @@
+"""
+Binary snapshots of parsed CSV files.
+
+compile_snapshot converts a CSV file into a columnar binary file next to
+it.  Integer columns are stored as int64 arrays, float columns as
+float64 arrays (plus their original text) and every other column as
+UTF-8 text with an int64 offset array.  Readers open the snapshot with
+mmap instead of parsing the CSV file again, as long as the snapshot was
+compiled from the current version of the file with the same separator
+and quote characters.
+
+File layout: the 8 byte magic string, an 8 byte little-endian header
+length, a JSON header describing every column, then the column sections,
+each starting on an 8 byte boundary.
+"""
+
+import array
+import csv
+import json
+import mmap
+import os
+import struct
+
+from column_table import ColumnTable, _typed_column
+
+MAGIC = b'CSVSNAP1'
+SNAPSHOT_SUFFIX = '.snap'
+_ALIGN = 8
+
+
+def snapshot_path(filename):
+    """
+    Returns the name of the snapshot file for the CSV file filename.
+    """
+    return filename + SNAPSHOT_SUFFIX
+
+
+def _padding(size):
+    """
+    Returns the zero bytes needed to pad size up to the section alignment.
+    """
+    return b'\0' * (-size % _ALIGN)
+
+
+def _text_sections(values):
+    """
+    Inputs:
+      values - list of strings (or None for missing fields)
+    Output:
+      Returns a tuple of the int64 offsets array bytes, the UTF-8 blob
+      and the list of row positions holding None.
+    """
+    offsets = array.array('q', [0])
+    chunks = []
+    nulls = []
+    total = 0
+    for idx, val in enumerate(values):
+        if val is None:
+            nulls.append(idx)
+            val = ''
+        data = val.encode('utf-8')
+        chunks.append(data)
+        total += len(data)
+        offsets.append(total)
+    return offsets.tobytes(), b''.join(chunks), nulls
+
+
+def compile_snapshot(filename, separator, quote, snapshot_file=None):
+    """
+    Inputs:
+      filename      - name of CSV file
+      separator     - character that separates fields
+      quote         - character used to optionally quote fields
+      snapshot_file - name of the snapshot to write (defaults to
+                      snapshot_path(filename))
+    Output:
+      Returns the name of the snapshot file written.  Raises ValueError
+      if a row has more fields than the header, since such rows cannot
+      be stored column by column.
+    """
+    if snapshot_file is None:
+        snapshot_file = snapshot_path(filename)
+    stat = os.stat(filename)
+    with open(filename, newline='') as csvfile:
+        csvreader = csv.reader(csvfile, delimiter=separator, quotechar=quote)
+        fieldnames = next(csvreader, [])
+        numfields = len(fieldnames)
+        values = [[] for _ in range(numfields)]
+        for row in csvreader:
+            if not row:
+                continue
+            if len(row) > numfields:
+                raise ValueError("row %d of %s has more fields than the header"
+                                 % (csvreader.line_num, filename))
+            for col, val in zip(values, row):
+                col.append(val)
+            for col in values[len(row):]:
+                col.append(None)
+
+    # Section positions are relative to the end of the header
+    sections = []
+    columns = []
+    position = 0
+    for col in values:
+        typed = _typed_column(col)
+        parts = []
+        if isinstance(typed, array.array):
+            info = {'kind': 'int' if typed.typecode == 'q' else 'float'}
+            parts.append(('data', typed.tobytes()))
+        else:
+            info = {'kind': 'str'}
+        if info['kind'] != 'int':
+            offsets, blob, info['nulls'] = _text_sections(col)
+            parts += [('offsets', offsets), ('blob', blob)]
+        for name, data in parts:
+            info[name] = [position, len(data)]
+            sections.append(data)
+            position += len(data) + len(_padding(len(data)))
+        columns.append(info)
+
+    header = json.dumps({"separator": separator, "quote": quote,
+                         "source_size": stat.st_size,
+                         "source_mtime_ns": stat.st_mtime_ns,
+                         "fieldnames": fieldnames,
+                         "numrows": len(values[0]) if values else 0,
+                         "columns": columns}).encode('utf-8')
+    header += b' ' * (-len(header) % _ALIGN)
+
+    tmp_file = snapshot_file + '.tmp'
+    with open(tmp_file, 'wb') as snapfile:
+        snapfile.write(MAGIC)
+        snapfile.write(struct.pack('<Q', len(header)))
+        snapfile.write(header)
+        for data in sections:
+            snapfile.write(data)
+            snapfile.write(_padding(len(data)))
+    os.replace(tmp_file, snapshot_file)
+    return snapshot_file
+
+
+class _TextColumn:
+    """
+    Sequence of the strings of one text column, decoded from the
+    mapped snapshot on access.
+    """
+
+    def __init__(self, offsets, blob, nulls):
+        self._offsets = offsets
+        self._blob = blob
+        self._nulls = frozenset(nulls)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if idx in self._nulls:
+            return None
+        return str(self._blob[self._offsets[idx]:self._offsets[idx + 1]], 'utf-8')
+
+    def __iter__(self):
+        blob = self._blob
+        offsets = self._offsets
+        nulls = self._nulls
+        for idx in range(len(self)):
+            if idx in nulls:
+                yield None
+            else:
+                yield str(blob[offsets[idx]:offsets[idx + 1]], 'utf-8')
+
+
+class Snapshot:
+    """
+    A snapshot file opened with mmap.
+
+    columns is a list with one entry per field, in field order: a
+    memoryview of int64 or float64 values for numeric columns, or a
+    _TextColumn for text columns.  texts holds the original text of
+    every column, with None for integer columns (whose text is str of
+    the value).
+    """
+
+    def __init__(self, snapshot_file):
+        with open(snapshot_file, 'rb') as snapfile:
+            self._mmap = mmap.mmap(snapfile.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError("%s is not a CSV snapshot" % snapshot_file)
+        header_len = struct.unpack('<Q', view[len(MAGIC):len(MAGIC) + 8])[0]
+        base = len(MAGIC) + 8
+        self.header = json.loads(bytes(view[base:base + header_len]))
+        base += header_len
+
+        self.fieldnames = self.header['fieldnames']
+        self.numrows = self.header['numrows']
+        self.columns = []
+        self.texts = []
+        for info in self.header['columns']:
+            text = None
+            if info['kind'] != 'int':
+                start, length = info['offsets']
+                offsets = view[base + start:base + start + length].cast('q')
+                start, length = info['blob']
+                text = _TextColumn(offsets, view[base + start:base + start + length],
+                                   info['nulls'])
+            if info['kind'] == 'str':
+                column = text
+            else:
+                start, length = info['data']
+                typecode = 'q' if info['kind'] == 'int' else 'd'
+                column = view[base + start:base + start + length].cast(typecode)
+            self.columns.append(column)
+            self.texts.append(text)
+
+    def matches(self, filename, separator, quote):
+        """
+        Returns True if this snapshot was compiled from the current
+        contents of filename with the given separator and quote.
+        """
+        stat = os.stat(filename)
+        header = self.header
+        return (header['separator'] == separator and header['quote'] == quote and
+                header['source_size'] == stat.st_size and
+                header['source_mtime_ns'] == stat.st_mtime_ns)
+
+    def to_column_table(self, keyfield=None):
+        """
+        Returns a ColumnTable whose numeric columns are views of the
+        mapped file.  The key column holds the original text of the
+        field, as read_csv_as_column_table keeps it.
+        """
+        columns = {}
+        for field, column, text in zip(self.fieldnames, self.columns, self.texts):
+            if field == keyfield and not isinstance(column, _TextColumn):
+                if text is None:
+                    # Integer columns are only stored if str gives back their text
+                    column = [str(val) for val in column]
+                else:
+                    column = list(text)
+            columns[field] = column
+        return ColumnTable(self.fieldnames, columns, keyfield)
+
+
+def open_current_snapshot(filename, separator, quote):
+    """
+    Inputs:
+      filename  - name of CSV file
+      separator - character that separates fields
+      quote     - character used to optionally quote fields
+    Output:
+      Returns the Snapshot of filename if one exists, is newer than the
+      file and was compiled with the same separator and quote, or None
+      otherwise.
+    """
+    snapshot_file = snapshot_path(filename)
+    try:
+        if os.stat(snapshot_file).st_mtime_ns < os.stat(filename).st_mtime_ns:
+            return None
+        snapshot = Snapshot(snapshot_file)
+    except (OSError, ValueError):
+        return None
+    if not snapshot.matches(filename, separator, quote):
+        return None
+    return snapshot
@@ -0,0 +1,246 @@
+"""
+GDP data from World Bank files as a matrix.
+
+The World Bank files hold one row per country and one column per year.
+A GdpStore parses every GDP value once into a countries x years float64
+array, with NaN for missing values, and indexes the rows by country
+name and by country code.  The GDP (or its log) of every country for a
+year is then a single column of the array, and the years between
+min_year and max_year are a slice of it, shared rather than copied.
+"""
+
+import csv
+import numpy
+from csv_cache import CsvLoadCache
+
+# Parsed GDP files shared between calls, e.g. one map per year
+GDP_CACHE = CsvLoadCache()
+
+
+class GdpMatrix:
+    """
+    GDP values of countries by year.
+
+    values is a countries x years float64 array holding NaN where a
+    value is missing.  keys lists the country of each row (a country
+    name or code) and years the year of each column, in increasing
+    order.  A window of years shares its arrays and indexes with the
+    matrix it was taken from.
+    """
+
+    def __init__(self, keys, years, values, rows=None):
+        self.keys = keys
+        self.years = numpy.asarray(years, dtype=int)
+        self.values = values
+        if rows is None:
+            # A key listed twice maps to its last row, as in the nested dictionaries
+            rows = {key: row for row, key in enumerate(keys)}
+        self.rows = rows
+        self._parent = None
+        self._log10 = None
+        self._missing = None
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def _year_bounds(self, min_year, max_year):
+        """
+        Returns the slice bounds of the columns for the years between
+        min_year and max_year, inclusive (None leaves a side open).
+        """
+        years = self.years
+        numyears = len(years)
+        if not numyears:
+            return 0, 0
+        if years[-1] - years[0] + 1 == numyears:
+            # One column per year: the bounds are offsets from the first year
+            low = 0 if min_year is None else min(max(min_year - years[0], 0), numyears)
+            high = numyears if max_year is None else min(max(max_year - years[0] + 1, 0), numyears)
+        else:
+            low = 0 if min_year is None else numpy.searchsorted(years, min_year, 'left')
+            high = numyears if max_year is None else numpy.searchsorted(years, max_year, 'right')
+        return int(low), int(max(low, high))
+
+    def window(self, min_year=None, max_year=None):
+        """
+        Returns a GdpMatrix of the years between min_year and max_year,
+        inclusive, whose arrays are views of this matrix's arrays.
+        """
+        low, high = self._year_bounds(min_year, max_year)
+        view = GdpMatrix(self.keys, self.years[low:high], self.values[:, low:high], self.rows)
+        view._parent = (self, low, high)
+        return view
+
+    def log10(self):
+        """
+        Returns the array of the log (base 10) of every value, NaN where
+        the value is missing.
+        """
+        if self._log10 is None:
+            if self._parent is not None:
+                parent, low, high = self._parent
+                self._log10 = parent.log10()[:, low:high]
+            else:
+                with numpy.errstate(divide='ignore', invalid='ignore'):
+                    self._log10 = numpy.log10(self.values)
+        return self._log10
+
+    def missing(self):
+        """
+        Returns a boolean array that is True where a value is missing.
+        """
+        if self._missing is None:
+            if self._parent is not None:
+                parent, low, high = self._parent
+                self._missing = parent.missing()[:, low:high]
+            else:
+                self._missing = numpy.isnan(self.values)
+        return self._missing
+
+    def year_column(self, year):
+        """
+        Returns the position of the column for year (an integer or a
+        string), or None if the matrix has no such year.
+        """
+        year = int(year)
+        low, high = self._year_bounds(year, year)
+        return low if high > low else None
+
+    def series(self, key):
+        """
+        Returns the list of (year, GDP) tuples of the country key for
+        the years with a value, in year order, or an empty list if key
+        is unknown.
+        """
+        row = self.rows.get(key)
+        if row is None:
+            return []
+        present = ~self.missing()[row]
+        return list(zip(self.years[present].tolist(), self.values[row, present].tolist()))
+
+    def map_dicts(self, plot_keys, years):
+        """
+        Inputs:
+          plot_keys - Dictionary mapping plot library country codes to
+                      keys of this matrix
+          years     - List of years (integers or strings)
+        Output:
+          A dictionary mapping each year in years to a tuple of a
+          dictionary and a set.  The dictionary maps the plot codes to
+          the log (base 10) of their GDP in that year; the set holds the
+          plot codes with no GDP value for that year.  Years not in the
+          matrix have no values.
+        """
+        codes = list(plot_keys)
+        rows = numpy.array([self.rows[plot_keys[code]] for code in codes], dtype=int)
+        result = {}
+        for year in years:
+            col = self.year_column(year)
+            if col is None:
+                result[year] = ({}, set(codes))
+                continue
+            present = ~self.missing()[rows, col]
+            values = self.log10()[rows, col].tolist()
+            result[year] = ({code: val for code, val, ok in zip(codes, values, present) if ok},
+                            {code for code, ok in zip(codes, present) if not ok})
+        return result
+
+    def map_dict(self, plot_keys, year):
+        """
+        Returns the (dictionary, set) tuple of map_dicts for a single
+        year.
+        """
+        return self.map_dicts(plot_keys, [year])[year]
+
+
+class GdpStore:
+    """
+    A parsed World Bank GDP file, with its rows indexed by country name
+    and, when the file has a code field, by country code.  Both indexes
+    share one countries x years array.
+    """
+
+    def __init__(self, names, codes, years, values):
+        self.names = GdpMatrix(names, years, values)
+        self.codes = None if codes is None else GdpMatrix(codes, years, values)
+
+    def by_name(self, min_year=None, max_year=None):
+        """
+        Returns a GdpMatrix keyed on country name for the years between
+        min_year and max_year, inclusive.
+        """
+        return self.names.window(min_year, max_year)
+
+    def by_code(self, min_year=None, max_year=None):
+        """
+        Returns a GdpMatrix keyed on country code for the years between
+        min_year and max_year, inclusive.  Raises KeyError if the file
+        has no code field.
+        """
+        if self.codes is None:
+            raise KeyError("GDP file has no country code field")
+        return self.codes.window(min_year, max_year)
+
+
+def read_gdp_store(filename, keyfields, separator, quote):
+    """
+    Inputs:
+      filename  - Name of World Bank GDP file
+      keyfields - Tuple of the country name field and the country code
+                  field (or None)
+      separator - Character that separates fields
+      quote     - Character used to optionally quote fields
+
+    Output:
+      Returns a GdpStore of the file, with one column for every field
+      whose name is a year.  Only a missing name field is an error; a
+      code field that is not in the file leaves the store without a
+      code index.
+    """
+    name_field, code_field = keyfields
+    with open(filename, newline='') as csvfile:
+        csvreader = csv.reader(csvfile, delimiter=separator, quotechar=quote)
+        fieldnames = next(csvreader, [])
+        name_col = fieldnames.index(name_field)
+        code_col = fieldnames.index(code_field) if code_field in fieldnames else None
+        year_cols = sorted((col for col, field in enumerate(fieldnames)
+                            if field.strip().isdigit()),
+                           key=lambda col: int(fieldnames[col]))
+        names = []
+        codes = []
+        cells = []
+        for row in csvreader:
+            if not row:
+                continue
+            row += [''] * (len(fieldnames) - len(row))
+            names.append(row[name_col])
+            if code_col is not None:
+                codes.append(row[code_col])
+            cells.append([row[col] for col in year_cols])
+
+    text = numpy.array(cells, dtype=str).reshape(len(names), len(year_cols))
+    text = numpy.char.strip(text)
+    values = numpy.where(text == '', 'nan', text).astype(float)
+    return GdpStore(names, codes if code_col is not None else None,
+                    [int(fieldnames[col]) for col in year_cols], values)
+
+
+def open_gdp_store(gdpinfo):
+    """
+    Inputs:
+      gdpinfo - A GDP information dictionary, as used by any of the
+                projects ("country_code" is optional)
+
+    Output:
+      Returns the GdpStore of the GDP file in gdpinfo, parsing the file
+      only if it has changed since it was last opened.
+    """
+    keyfields = (gdpinfo['country_name'], gdpinfo.get('country_code'))
+    return GDP_CACHE.load(read_gdp_store, gdpinfo['gdpfile'], keyfields,
+                          gdpinfo['separator'], gdpinfo['quote'])
@@ -0,0 +1,224 @@
+"""
+Fuzzy matching of country names.
+
+Country names are spelled differently by different sources ("Korea,
+Republic of" and "Korea, Rep.", "Viet Nam" and "Vietnam").  A NameIndex
+normalizes every known name once (casefolding, accent stripping,
+abbreviation expansion and token sorting) and indexes the normalized
+names by character trigram, so matching a name only scores the known
+names that share trigrams with it instead of every known name.
+
+Matches can be saved to a JSON file and reused by later runs for the
+same set of known names.
+"""
+
+import hashlib
+import json
+import os
+import re
+import unicodedata
+from collections import Counter
+
+# Words dropped from names before comparing them
+STOP_WORDS = frozenset(['the', 'of', 'and'])
+
+# Abbreviations expanded before comparing names
+ABBREVIATIONS = {
+    'rep': 'republic',
+    'dem': 'democratic',
+    'pdr': 'peoples democratic republic',
+    'fyr': 'former yugoslav republic',
+    'st': 'saint',
+    'sts': 'states',
+    'fed': 'federated',
+}
+
+# Words that say little about which country is meant, left out of the
+# fuzzy score (but not of exact normalized matches)
+GENERIC_WORDS = frozenset(['republic', 'state', 'states', 'democratic', 'peoples'])
+
+# Smallest trigram similarity accepted as a fuzzy match
+MIN_SCORE = 0.6
+
+_NON_WORD = re.compile(r'[^\w]+')
+
+
+def name_tokens(name):
+    """
+    Returns the sorted list of normalized words of name: accents
+    stripped, casefolded, punctuation removed, abbreviations expanded
+    and stop words dropped.
+    """
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(char for char in name if not unicodedata.combining(char))
+    name = name.casefold().replace("'", '')
+    words = []
+    for word in _NON_WORD.sub(' ', name).split():
+        words.extend(ABBREVIATIONS.get(word, word).split())
+    return sorted(word for word in words if word not in STOP_WORDS)
+
+
+def normalize_name(name):
+    """
+    Returns the normalized form of name that exact matches compare.
+    """
+    return ' '.join(name_tokens(name))
+
+
+def _trigrams(tokens):
+    """
+    Returns the set of character trigrams of the words in tokens, each
+    word padded with a space on both sides.
+    """
+    grams = set()
+    for token in tokens:
+        padded = ' ' + token + ' '
+        grams.update(padded[idx:idx + 3] for idx in range(len(padded) - 2))
+    return grams
+
+
+def _score_trigrams(tokens):
+    """
+    Returns the trigrams fuzzy scores are computed from: those of the
+    words in tokens other than generic words, or of every word if all
+    are generic.
+    """
+    specific = [token for token in tokens if token not in GENERIC_WORDS]
+    return _trigrams(specific or tokens)
+
+
+class NameIndex:
+    """
+    Index of known names for exact, normalized and fuzzy lookups.
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.known = set(self.names)
+        self.normalized = {}
+        self.grams = []
+        self.postings = {}
+        for idx, name in enumerate(self.names):
+            tokens = name_tokens(name)
+            self.normalized.setdefault(' '.join(tokens), name)
+            grams = _score_trigrams(tokens)
+            self.grams.append(grams)
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(idx)
+        self.fingerprint = hashlib.sha1(
+            '\n'.join(sorted(self.names)).encode('utf-8')).hexdigest()
+
+    def candidates(self, name, min_score=MIN_SCORE):
+        """
+        Returns a list of (score, known name) pairs for the known names
+        whose trigram similarity (Dice coefficient) with name is at least
+        min_score, best first.  Only known names sharing a trigram with
+        name are scored.
+        """
+        grams = _score_trigrams(name_tokens(name))
+        if not grams:
+            return []
+        shared = Counter(idx for gram in grams for idx in self.postings.get(gram, ()))
+        result = []
+        for idx, count in shared.items():
+            score = 2.0 * count / (len(grams) + len(self.grams[idx]))
+            if score >= min_score:
+                result.append((score, self.names[idx]))
+        result.sort(key=lambda item: (-item[0], item[1]))
+        return result
+
+    def match_all(self, names, min_score=MIN_SCORE, cache_file=None):
+        """
+        Inputs:
+          names      - Iterable of names to match
+          min_score  - Smallest trigram similarity accepted
+          cache_file - Optional JSON file of earlier matches, read
+                       before matching and updated afterwards
+
+        Output:
+          Returns a dictionary mapping each name to the known name it
+          matches, or None.  Names are matched exactly first, then from
+          the cache, then by normalized form, then fuzzily, best scores
+          first; a known name matched by one name is not matched again
+          by another.  Cached matches are kept per set of known names
+          and min_score.
+        """
+        names = list(names)
+        cache = _read_cache(cache_file)
+        cache_key = '%s:%r' % (self.fingerprint, float(min_score))
+        cached = cache.get(cache_key, {})
+        matches = {}
+        claimed = set()
+        pending = []
+        for name in names:
+            if name in self.known:
+                matches[name] = name
+                claimed.add(name)
+        for name in names:
+            if name in matches:
+                continue
+            if name in cached and cached[name] is None:
+                matches[name] = None
+            elif name in cached and cached[name] not in claimed:
+                matches[name] = cached[name]
+                claimed.add(cached[name])
+            else:
+                pending.append(name)
+
+        fuzzy = []
+        contested = set()
+        for name in pending:
+            match = self.normalized.get(normalize_name(name))
+            if match is not None and match not in claimed:
+                matches[name] = match
+                claimed.add(match)
+            else:
+                fuzzy.append(name)
+                if match is not None:
+                    contested.add(name)
+
+        pairs = sorted(((score, name, known) for name in fuzzy
+                        for score, known in self.candidates(name, min_score)),
+                       key=lambda item: (-item[0], item[1], item[2]))
+        for name in fuzzy:
+            matches[name] = None
+        for _, name, known in pairs:
+            contested.add(name)
+            if matches[name] is None and known not in claimed:
+                matches[name] = known
+                claimed.add(known)
+
+        if cache_file is not None:
+            # A miss is only saved if no known name came close, since a
+            # name lost to another one may match in a later call
+            cached.update((name, match) for name, match in matches.items()
+                          if match is not None or name not in contested)
+            cache[cache_key] = cached
+            _write_cache(cache_file, cache)
+        return matches
+
+
+def _read_cache(cache_file):
+    """
+    Returns the contents of the JSON match cache, or an empty dictionary
+    if there is none or it cannot be read.
+    """
+    if cache_file is None:
+        return {}
+    try:
+        with open(cache_file, encoding='utf-8') as jsonfile:
+            cache = json.load(jsonfile)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def _write_cache(cache_file, cache):
+    """
+    Writes the match cache, replacing the old file only once the new one
+    is complete.
+    """
+    tmp_file = cache_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as jsonfile:
+        json.dump(cache, jsonfile, indent=1, sort_keys=True)
+    os.replace(tmp_file, cache_file)
@@ -0,0 +1,118 @@
+"""
+Skip re-rendering charts whose inputs have not changed.
+
+A chart's content hash covers the data plotted, the chart settings and
+the pygal version.  After a chart is rendered its hash is saved in a
+small sidecar file next to the output file, and the next render with the
+same hash is skipped as long as the output file is untouched.  The hash
+identifies the rendered content, so it can also be sent as an HTTP ETag.
+"""
+
+import hashlib
+import json
+import os
+import pygal
+
+HASH_SUFFIX = '.render-hash'
+
+
+def _canonical(value):
+    """
+    Returns value converted to JSON-compatible data with a fixed order:
+    dictionaries are sorted by key and sets are sorted.
+    """
+    if isinstance(value, dict):
+        return [[_canonical(key), _canonical(val)]
+                for key, val in sorted(value.items(), key=lambda item: repr(item[0]))]
+    if isinstance(value, (set, frozenset)):
+        return sorted((_canonical(val) for val in value), key=repr)
+    if isinstance(value, (list, tuple)):
+        return [_canonical(val) for val in value]
+    if isinstance(value, float):
+        # repr keeps every digit, so any change in a value changes the hash
+        return repr(value)
+    return value
+
+
+def content_hash(data, config):
+    """
+    Inputs:
+      data   - Values plotted (dictionaries, sets, lists, tuples,
+               strings and numbers)
+      config - Dictionary of the chart settings (chart type, title,
+               series names, ...)
+    Output:
+      Returns the hex SHA-256 hash of data, config and the pygal version.
+    """
+    payload = json.dumps([pygal.__version__, _canonical(config), _canonical(data)],
+                         separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def etag(digest):
+    """
+    Returns the HTTP ETag header value for a content hash.
+    """
+    return '"%s"' % digest
+
+
+def hash_path(output_file):
+    """
+    Returns the name of the sidecar file holding the hash of output_file.
+    """
+    return output_file + HASH_SUFFIX
+
+
+def stored_hash(output_file):
+    """
+    Returns the content hash output_file was rendered from, or None if
+    it is unknown or the file has changed since it was rendered.
+    """
+    try:
+        with open(hash_path(output_file), encoding='utf-8') as hashfile:
+            record = json.load(hashfile)
+        stat = os.stat(output_file)
+    except (OSError, ValueError):
+        return None
+    if (not isinstance(record, dict) or record.get('size') != stat.st_size or
+            record.get('mtime_ns') != stat.st_mtime_ns):
+        return None
+    return record.get('hash')
+
+
+def _write_atomic(filename, data):
+    """
+    Writes data (bytes or str) to filename through a temporary file, so
+    readers never see a partly written file.
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    tmp_file = '%s.%d.tmp' % (filename, os.getpid())
+    try:
+        with open(tmp_file, 'wb') as outfile:
+            outfile.write(data)
+        os.replace(tmp_file, filename)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+def render_if_changed(render, output_file, digest):
+    """
+    Inputs:
+      render      - Function returning the rendered chart (bytes or str)
+      output_file - Name of the file to write
+      digest      - Content hash of the chart (see content_hash)
+    Output:
+      Returns True if the chart was rendered and written, or False if
+      output_file already holds the chart for digest.
+    """
+    if stored_hash(output_file) == digest:
+        return False
+    _write_atomic(output_file, render())
+    stat = os.stat(output_file)
+    _write_atomic(hash_path(output_file),
+                  json.dumps({'hash': digest, 'size': stat.st_size,
+                              'mtime_ns': stat.st_mtime_ns}))
+    return True
@@ -0,0 +1,66 @@
+"""
+World map rendering shared by the Week 3 and Week 4 projects.
+
+Both projects reduce the GDP data for a year to the same three series
+(log GDP by plot code, countries missing from the World Bank data and
+countries with no value for the year) and draw them the same way.  The
+maps of several years are rendered in parallel, each skipped when its
+file already holds the same map (see render_cache).
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import pygal
+from render_cache import content_hash, render_if_changed
+
+
+def render_map_file(year, cc_gdp, set1, set2, map_file):
+    """
+    Inputs:
+      year     - Year of the data (string or integer)
+      cc_gdp   - Dictionary mapping plot codes to log (base 10) GDP
+      set1     - Set of plot codes missing from the World Bank data
+      set2     - Set of plot codes with no GDP data for the year
+      map_file - Name of output file to create
+
+    Output:
+      Returns map_file.
+
+    Action:
+      Renders one world map SVG file, unless map_file already holds the
+      same map.  Runs in a worker process for render_map_files.
+    """
+    title="GDP of Countries in Log scale"
+    labels=[str(year), "Missing From World Bank Data", "GDP Data Missing"]
+    digest=content_hash([cc_gdp, set1, set2],
+                        {"chart": "World", "title": title, "series": labels})
+
+    def render():
+        worldmap_chart = pygal.maps.world.World()
+        worldmap_chart.title=title
+        for label, values in zip(labels, (cc_gdp, set1, set2)):
+            worldmap_chart.add(label, values)
+        return worldmap_chart.render()
+
+    render_if_changed(render, map_file, digest)
+    return map_file
+
+
+def render_map_files(map_dicts, years, map_pattern, workers=None):
+    """
+    Inputs:
+      map_dicts   - Dictionary mapping each year in years to a tuple of
+                    the three series of render_map_file
+      years       - List of years to create maps for
+      map_pattern - Output file name containing "{year}", which is
+                    replaced by each year
+      workers     - Number of worker processes used for rendering
+                    (None uses one per CPU, 1 renders in this process)
+
+    Output:
+      Returns a list of the map files written, in the order of years.
+    """
+    jobs=[(year,)+tuple(map_dicts[year])+(map_pattern.format(year=year),) for year in years]
+    if workers == 1 or not jobs:
+        return [render_map_file(*job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(render_map_file, *zip(*jobs)))